@@ -0,0 +1,183 @@
+import codecs
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Matches "NPD Traits Analysis: X%" and "NPD特征分析：X%"
+SCORE_PATTERN = re.compile(r"(?:NPD\s*Traits\s*Analysis|NPD\s*特征分析)\s*[:：]\s*(\d+(?:\.\d+)?)\s*[%％]", re.IGNORECASE)
+
+
+def build_analysis_prompt(conversation: str, lang: str) -> str:
+    """
+    Build the NPD analysis prompt for a conversation transcript.
+    """
+    if lang == "English":
+        return f"""
+Analyze the following conversation for signs of narcissistic personality disorder (NPD) traits.\nFocus on identifying instances of:\n1. Gaslighting\n2. Love bombing\n3. Blame-shifting\n4. Other NPD characteristics\n\nBased on these factors, provide a percentage indicating how strongly the conversation shows NPD traits.\nFormat your response as: \"NPD Traits Analysis: X%\"\nThen provide a brief explanation of why.\n\nConversation to analyze:\n{conversation}
+"""
+    return f"""
+请分析以下对话是否具有自恋型人格障碍（NPD）的特征。\n重点识别：\n1. 煤气灯效应\n2. 爱轰炸\n3. 推卸责任\n4. 其他NPD特征\n\n请根据这些因素，给出该对话表现出NPD特征的百分比。\n请用如下格式回答：\"NPD特征分析：X%\"\n并简要说明原因。\n\n待分析对话：\n{conversation}
+"""
+
+
+def parse_analysis_score(analysis_text: str):
+    """
+    Extract the NPD percentage from an analysis response, or None if it is missing.
+    """
+    match = SCORE_PATTERN.search(analysis_text)
+    if not match:
+        return None
+    return min(float(match.group(1)), 100.0)
+
+
+def iter_decoded_lines(binary_file, encoding: str = "utf-8", chunk_size: int = 65536):
+    """
+    Decode a binary file chunk by chunk and yield its lines without the line endings.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    while True:
+        chunk = binary_file.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if not chunk:
+            break
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def split_windows(lines, max_chars: int = 12000, overlap_lines: int = 4):
+    """
+    Group message lines into windows of at most max_chars characters.
+
+    Windows break only between lines (one message per line in chat exports) and
+    repeat the last overlap_lines messages of the previous window for context.
+    A single line longer than max_chars becomes its own window. Yields
+    (first_line_number, last_line_number, text) with 1-based line numbers.
+    """
+    window = []
+    size = 0
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        if window and size + len(line) + 1 > max_chars:
+            yield window[0][0], window[-1][0], "\n".join(text for _, text in window)
+            window = window[-overlap_lines:] if overlap_lines else []
+            # Drop overlap if it alone would overflow the next window
+            while window and sum(len(text) + 1 for _, text in window) + len(line) + 1 > max_chars:
+                window.pop(0)
+            size = sum(len(text) + 1 for _, text in window)
+        window.append((line_no, line))
+        size += len(line) + 1
+    if window:
+        yield window[0][0], window[-1][0], "\n".join(text for _, text in window)
+
+
+def analyze_windows(windows: list, lang: str, generate, max_workers: int = 4, on_progress=None) -> list:
+    """
+    Analyze transcript windows concurrently with at most max_workers calls in flight.
+
+    generate is called with each analysis prompt and must return the response
+    text. on_progress(done, total) is called from the calling thread as windows
+    finish. Workers run in a copy of the caller's context, so per-session
+    scheduling still applies. Returns one result dict per window, in transcript
+    order; a window whose call failed gets score None and its error text, so
+    one bad window does not lose the others.
+    """
+    results = [None] * len(windows)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, generate, build_analysis_prompt(text, lang)): index
+            for index, (_, _, text) in enumerate(windows)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            first, last, text = windows[index]
+            result = {"first_line": first, "last_line": last, "chars": len(text), "score": None, "text": ""}
+            try:
+                response_text = future.result()
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            else:
+                result.update(score=parse_analysis_score(response_text), text=response_text)
+            results[index] = result
+            if on_progress:
+                on_progress(done, len(windows))
+    return results
+
+
+def merge_scores(results: list):
+    """
+    Combine per-window scores into one score weighted by window length.
+    """
+    scored = [r for r in results if r["score"] is not None]
+    total = sum(r["chars"] for r in scored)
+    if not total:
+        return None
+    return sum(r["score"] * r["chars"] for r in scored) / total
+
+
+def _highlight(analysis_text: str, limit: int = 200) -> str:
+    explanation = SCORE_PATTERN.sub("", analysis_text).strip().replace("\n", " ")
+    return explanation if len(explanation) <= limit else explanation[:limit].rstrip() + "…"
+
+
+def format_merged_analysis(results: list, lang: str) -> str:
+    """
+    Render the merged score and per-section highlights as markdown.
+    """
+    score = merge_scores(results)
+    if lang == "English":
+        header = f"NPD Traits Analysis: {score:.0f}%" if score is not None else "NPD Traits Analysis: unavailable"
+        section = "Lines {first}–{last}"
+    else:
+        header = f"NPD特征分析：{score:.0f}%" if score is not None else "NPD特征分析：无法得出"
+        section = "第{first}–{last}行"
+    lines = [f"**{header}**", ""]
+    for r in results:
+        label = section.format(first=r["first_line"], last=r["last_line"])
+        if r.get("error"):
+            failed = "failed" if lang == "English" else "失败"
+            lines.append(f"- **{label}** ({failed}): {_highlight(r['error'])}")
+            continue
+        score_text = f"{r['score']:.0f}%" if r["score"] is not None else "?"
+        lines.append(f"- **{label}** ({score_text}): {_highlight(r['text'])}")
+    return "\n".join(lines)
+
+
+def analyze_transcript(lines, lang: str, generate, max_chars: int = 12000, overlap_lines: int = 4,
+                       max_workers: int = 4, on_progress=None, text: str = None) -> dict:
+    """
+    Analyze one transcript given as message lines and return its NPD score.
+
+    A transcript that fits in one window is sent as a single prompt; longer
+    ones are split and analyzed with analyze_windows, then merged from the
+    windows that succeeded; it only raises when every window failed. When the
+    original text is passed and fits in one window it is sent unchanged, blank
+    lines included, so the prompt matches a plain single-prompt analysis.
+    Returns {"score": float or None, "analysis": text, "windows": count, "failed_windows": count}.
+    """
+    if text is not None and text.strip() and len(text) <= max_chars:
+        return _analyze_single(text, lang, generate)
+    windows = list(split_windows(lines, max_chars, overlap_lines))
+    if not windows:
+        return {"score": None, "analysis": "", "windows": 0, "failed_windows": 0}
+    if len(windows) == 1:
+        return _analyze_single(windows[0][2], lang, generate)
+    results = analyze_windows(windows, lang, generate, max_workers=max_workers, on_progress=on_progress)
+    failed = [r for r in results if r.get("error")]
+    if len(failed) == len(results):
+        raise RuntimeError(f"All {len(results)} analysis sections failed; first error: {failed[0]['error']}")
+    return {
+        "score": merge_scores(results),
+        "analysis": format_merged_analysis(results, lang),
+        "windows": len(windows),
+        "failed_windows": len(failed),
+    }
+
+
+def _analyze_single(conversation: str, lang: str, generate) -> dict:
+    analysis = generate(build_analysis_prompt(conversation, lang))
+    return {"score": parse_analysis_score(analysis), "analysis": analysis, "windows": 1, "failed_windows": 0}
@@ -1,9 +1,31 @@
 import streamlit as st
-import google.generativeai as genai
-from dotenv import load_dotenv
-import os
 import random
-from utils import sign_map, model, build_chat_prompt, parse_response
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from utils import (
+    sign_map, MODEL, get_client, build_chat_prompt, iter_response_text, STREAM_CHAT, STRUCTURED_CHAT,
+    OPENING_TURN, WARM_POOL_SIZE, WARM_POOL_MAX_AGE, WARM_POOL_PROFILES, WARM_POOL_MIN_DEMAND,
+    build_persona_prompt, PersonaModel, PERSONA_CACHE_SIZE,
+    CACHE_PATH, CACHE_TTL, CACHE_SIZE, CACHE_DISK_SIZE,
+    ANALYSIS_WINDOW_CHARS, ANALYSIS_OVERLAP_LINES, ANALYSIS_WORKERS, LARGE_UPLOAD_BYTES,
+    RADAR_TRIAGE, RADAR_LOW, RADAR_HIGH, RADAR_MIN_LINES, RADAR_MIN_HITS,
+    HISTORY_RECENT_TURNS, CONTEXT_TOKEN_BUDGET, CONTEXT_RECENT_TURNS, SESSION_MEMORY_BYTES, SPILL_PATH,
+    SESSION_DB_PATH, SESSION_FLUSH_INTERVAL, SESSION_TTL, SESSION_MEMORY_MAX,
+    METRICS_PORT, METRICS_FILE, METRICS_INTERVAL, PROFILE_SAMPLE_RATE, PROFILE_DIR, scheduler,
+)
+from cache import ResponseCache, make_cache_key
+from llm_client import CircuitOpenError, is_quota_error
+from scheduler import AdmissionTimeoutError, set_session
+from context import ConversationContext
+from transcript import Transcript, SpillStore, Message
+from sessions import create_session_store, new_token, SETTINGS_KEYS
+from structured import (
+    build_structured_chat_prompt, build_opening_prompt, is_unknown_tactic, parse_structured_response,
+    StructuredReplyStream,
+)
+from warm_pool import WarmPool
+from radar import Radar, format_radar_summary, format_radar_report
+from analysis import iter_decoded_lines, analyze_transcript
+from metrics import RerunTimer, registry, stats_collector, start_http_exporter, start_file_exporter
 
 # Define sign_map globally so it's available everywhere
 # sign_map = [
@@ -19,6 +41,63 @@ st.set_page_config(
     layout="centered"
 )
 
+# Per-run timings (and a sampled cProfile dump) for the metrics exporter
+rerun_timer = RerunTimer(PROFILE_SAMPLE_RATE, PROFILE_DIR)
+
+# Attribute this run's model calls to the session for fair scheduling across users
+script_ctx = get_script_run_ctx()
+set_session(script_ctx.session_id if script_ctx else "default")
+
+
+# Process-wide stores for spilled messages and durable sessions
+@st.cache_resource(show_spinner=False)
+def get_spill_store() -> SpillStore:
+    """
+    Process-wide on-disk store for cold messages of long sessions.
+    """
+    return SpillStore(SPILL_PATH)
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    """
+    Durable store shared by every worker, so any of them can resume a session from its token.
+    """
+    return create_session_store(SESSION_DB_PATH or None, SESSION_FLUSH_INTERVAL, SESSION_TTL, SESSION_MEMORY_MAX)
+
+
+session_store = get_session_store()
+
+
+def new_transcript(token: str) -> Transcript:
+    """
+    Empty transcript whose appends and guess updates are written behind to the session store.
+    """
+    return Transcript(
+        get_spill_store(),
+        SESSION_MEMORY_BYTES,
+        min_hot=2 * HISTORY_RECENT_TURNS,
+        on_change=lambda idx, message: session_store.save_message(token, idx, message),
+    )
+
+
+# Resume a session from its ?session= token when this worker has not seen it (restart or another worker)
+session_token = st.query_params.get("session")
+if session_token and "messages" not in st.session_state:
+    restored = session_store.load(session_token)
+    if restored is None:
+        # Unknown or expired token: start over with the settings page
+        del st.query_params["session"]
+        session_token = None
+    else:
+        settings, messages = restored
+        for key, value in settings.items():
+            st.session_state[key] = value
+        st.session_state["persisted_settings"] = settings
+        st.session_state["settings_done"] = True
+        st.session_state.messages = new_transcript(session_token)
+        st.session_state.messages.restore(messages)
+
 # Global language selector in sidebar (always available)
 st.sidebar.radio(
     "🌐 Language / 语言",
@@ -26,8 +105,92 @@ st.sidebar.radio(
     key="language_select"
 )
 
-# 3. Choose your Gemini model
-MODEL = "models/gemini-1.5-flash"   # free Flash model
+# 3. Gemini model (MODEL) and client come from utils; the client is built on first use
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> ResponseCache:
+    """
+    Process-wide response cache shared by all sessions.
+    """
+    return ResponseCache(CACHE_PATH or None, max_entries=CACHE_SIZE, ttl=CACHE_TTL, disk_max_entries=CACHE_DISK_SIZE)
+
+
+response_cache = get_response_cache()
+
+
+def generate_cached(prompt: str, lang: str) -> str:
+    """
+    Return the model's text for a stateless prompt, served from the response cache when possible.
+    """
+    cache_key = make_cache_key(prompt, MODEL, lang)
+    text = response_cache.get(cache_key)
+    if text is None:
+        text = get_client().generate_content(prompt).text
+        response_cache.set(cache_key, text)
+    return text
+
+
+def current_profile() -> tuple:
+    """
+    The (language, intensity, signs) settings profile a session's persona is built from.
+    """
+    return (
+        st.session_state.get("language_select", "English"),
+        st.session_state.get("intensity_select", "Medium"),
+        tuple(st.session_state.get("signs_select", ["Gaslighting", "Love bombing", "Blame-shifting"])),
+    )
+
+
+def generate_opening(profile: tuple) -> tuple:
+    """
+    Generate and parse the simulated person's opening turn for a settings profile.
+    """
+    lang, intensity, signs = profile
+    persona = PersonaModel(get_client(), build_persona_prompt(lang, intensity, list(signs)))
+    text = persona.generate_content(build_opening_prompt(list(signs), lang, STRUCTURED_CHAT)).text
+    return parse_structured_response(text, list(signs), lang)
+
+
+@st.cache_resource(show_spinner=False)
+def get_warm_pool() -> WarmPool:
+    """
+    Process-wide pool of pre-generated opening turns, refilled in the background.
+    """
+    return WarmPool(generate_opening, WARM_POOL_SIZE, WARM_POOL_MAX_AGE, WARM_POOL_PROFILES, WARM_POOL_MIN_DEMAND)
+
+
+@st.cache_resource(show_spinner=False)
+def get_radar() -> Radar:
+    """
+    Precompiled red-flag matcher, built once per process.
+    """
+    return Radar()
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics():
+    """
+    Register the process-wide collectors once and start the configured metrics exporters.
+    """
+    registry.register_collector(stats_collector(
+        "mirrorshield_response_cache", response_cache.stats, ("hits", "misses", "disk_hits")
+    ))
+    registry.register_collector(stats_collector("mirrorshield_scheduler", scheduler.stats, ("deduplicated",)))
+    registry.register_collector(stats_collector(
+        "mirrorshield_warm_pool", get_warm_pool().stats, ("hits", "misses", "generated", "failures")
+    ))
+    registry.register_collector(lambda: [(
+        "mirrorshield_llm_breaker_state", "gauge", "1 for the circuit breaker's current state",
+        [({"state": state}, int(get_client().breaker.state == state)) for state in ("closed", "half-open", "open")],
+    )])
+    if METRICS_PORT:
+        start_http_exporter(int(METRICS_PORT))
+    if METRICS_FILE:
+        start_file_exporter(METRICS_FILE, METRICS_INTERVAL)
+
+
+start_metrics()
+rerun_timer.lap("setup")
+
 
 # Initial settings page
 if "settings_done" not in st.session_state or not st.session_state["settings_done"]:
@@ -91,28 +254,63 @@ if "settings_done" not in st.session_state or not st.session_state["settings_don
             key="settings_upload"
         )
         analyze_text = ""
-        if uploaded_file is not None:
-            analyze_text = uploaded_file.read().decode("utf-8")
+        large_upload = uploaded_file is not None and uploaded_file.size > LARGE_UPLOAD_BYTES
+        if large_upload:
+            # Large files are never decoded in full; they are streamed into windows on demand
+            st.caption(
+                f"Large file ({uploaded_file.size // 1024} KB) will be analyzed in sections."
+                if lang == "English" else
+                f"文件较大（{uploaded_file.size // 1024} KB），将分段分析。"
+            )
+        elif uploaded_file is not None:
+            analyze_text = uploaded_file.getvalue().decode("utf-8")
         analyze_text = st.text_area(
             "Or paste conversation text here:" if lang == "English" else "或在此粘贴对话内容：",
             value=analyze_text,
             height=200,
             key="settings_analyze_input"
         )
+        text_report = None
+        if analyze_text.strip():
+            # Instant local feedback; no model call
+            text_report = get_radar().scan(analyze_text.splitlines())
+            st.caption(format_radar_summary(text_report, lang))
         analyze_result = ""
         if st.button("Get Analysis" if lang == "English" else "获取分析", key="settings_run_analysis"):
-            if analyze_text.strip():
+            if large_upload or analyze_text.strip():
                 try:
-                    if lang == "English":
-                        analysis_prompt = f"""
-Analyze the following conversation for signs of narcissistic personality disorder (NPD) traits.\nFocus on identifying instances of:\n1. Gaslighting\n2. Love bombing\n3. Blame-shifting\n4. Other NPD characteristics\n\nBased on these factors, provide a percentage indicating how strongly the conversation shows NPD traits.\nFormat your response as: \"NPD Traits Analysis: X%\"\nThen provide a brief explanation of why.\n\nConversation to analyze:\n{analyze_text}
-"""
+                    report = None
+                    if large_upload:
+                        # Only radar triage needs the extra pass over the file
+                        if RADAR_TRIAGE:
+                            uploaded_file.seek(0)
+                            report = get_radar().scan(iter_decoded_lines(uploaded_file))
+                        uploaded_file.seek(0)
+                        lines = iter_decoded_lines(uploaded_file)
                     else:
-                        analysis_prompt = f"""
-请分析以下对话是否具有自恋型人格障碍（NPD）的特征。\n重点识别：\n1. 煤气灯效应\n2. 爱轰炸\n3. 推卸责任\n4. 其他NPD特征\n\n请根据这些因素，给出该对话表现出NPD特征的百分比。\n请用如下格式回答：\"NPD特征分析：X%\"\n并简要说明原因。\n\n待分析对话：\n{analyze_text}
-"""
-                    response = model.generate_content(analysis_prompt)
-                    analyze_result = response.text
+                        lines = analyze_text.splitlines()
+                        report = text_report
+                    # Clearly benign or clearly flagged text is answered by the radar alone
+                    verdict = "uncertain"
+                    if RADAR_TRIAGE and report is not None:
+                        verdict = report.verdict(RADAR_LOW, RADAR_HIGH, RADAR_MIN_LINES, RADAR_MIN_HITS)
+                    if verdict != "uncertain":
+                        analyze_result = format_radar_report(report, lang, verdict)
+                    else:
+                        progress = st.empty()
+                        analyze_result = analyze_transcript(
+                            lines,
+                            lang,
+                            lambda prompt: generate_cached(prompt, lang),
+                            max_chars=ANALYSIS_WINDOW_CHARS,
+                            overlap_lines=ANALYSIS_OVERLAP_LINES,
+                            max_workers=ANALYSIS_WORKERS,
+                            text=None if large_upload else analyze_text,
+                            on_progress=lambda done, total: progress.progress(
+                                done / total, text="Analyzing sections..." if lang == "English" else "正在分段分析……"
+                            ),
+                        )["analysis"]
+                        progress.empty()
                     st.markdown(analyze_result)
                 except Exception as e:
                     st.error(("Analysis failed: " if lang == "English" else "分析失败：") + str(e))
@@ -155,21 +353,13 @@ Analyze the following conversation for signs of narcissistic personality disorde
         div[data-testid="stButton"] { display: flex; justify-content: center; }
         </style>
     """, unsafe_allow_html=True)
-    if st.button("Continue" if st.session_state.get("language_select", "English") == "English" else "继续", key="center_continue", help=None, type="secondary"):
-        lang = st.session_state["language_select"]
-        intensity_labels = [x[0] if lang == "English" else x[1] for x in [
-            ("Low", "低"),
-            ("Medium", "中"),
-            ("High", "高"),
-            ("Random", "随机")
-        ]]
-        sign_labels = [x[0] if lang == "English" else x[1] for x in [
-            ("Gaslighting", "煤气灯效应"),
-            ("Love bombing", "爱轰炸"),
-            ("Blame-shifting", "推卸责任")
-        ]]
-        st.session_state["settings_done"] = True
-        st.rerun()
+    # Set in the click callback, so the click's own run already renders the chat instead of rerunning
+    st.button(
+        "Continue" if st.session_state.get("language_select", "English") == "English" else "继续",
+        key="center_continue", help=None, type="secondary",
+        on_click=lambda: st.session_state.update(settings_done=True),
+    )
+    rerun_timer.finish("settings")
     st.stop()
 
 # 6. Sidebar with your Red Flag Guide
@@ -191,7 +381,12 @@ with st.sidebar:
             st.markdown("**Randomized Settings: Enabled**" if lang == "English" else "**随机设置：已启用**")
         st.markdown("---")
         if st.button("Exit Session" if lang == "English" else "退出会话", key="exit_session"):
-            for k in ["settings_done", "chat", "messages", "intensity_select", "signs_select", "random_mode", "settings_upload", "settings_analyze_input"]:
+            if "messages" in st.session_state:
+                st.session_state.messages.close()
+            if session_token:
+                session_store.delete(session_token)
+                del st.query_params["session"]
+            for k in ["settings_done", "chat", "messages", "context", "persisted_settings", "opening_tried", "intensity_select", "signs_select", "random_mode", "settings_upload", "settings_analyze_input"]:
                 if k in st.session_state:
                     del st.session_state[k]
             st.rerun()
@@ -238,123 +433,204 @@ with st.sidebar:
         聊天时请注意这些模式！
         """
     )
+rerun_timer.lap("sidebar")
 
 # 7. Initialize or retrieve a single chat session
+@st.cache_resource(max_entries=PERSONA_CACHE_SIZE, show_spinner=False)
+def get_persona_model(lang: str, intensity: str, signs: tuple) -> PersonaModel:
+    """
+    Return the persona-configured model for a settings profile, shared across sessions.
+    """
+    return PersonaModel(get_client(), build_persona_prompt(lang, intensity, list(signs)))
+
+
 if "chat" not in st.session_state:
-    lang = st.session_state.get("language_select", "English")
-    intensity = st.session_state.get("intensity_select", "Medium")
-    signs = st.session_state.get("signs_select", ["Gaslighting", "Love bombing", "Blame-shifting"])
-    # Compose the system prompt based on settings
-    if lang == "English":
-        signs_text = ", ".join(signs)
-        system_prompt = (
-            f"You are simulating someone with narcissistic personality disorder traits. "
-            f"Your responses should demonstrate the following: {signs_text}. "
-            f"Intensity: {intensity.lower()}. "
-            f"Remain realistic and conversational."
-        )
-    else:
-        sign_map_dict = dict(sign_map)
-        signs_text = "，".join([sign_map_dict.get(s, s) for s in signs])
-        system_prompt = (
-            f"你正在模拟具有自恋型人格障碍特征的人。你的回复应体现以下特征：{signs_text}。"
-            f"强度：{intensity}。"
-            f"同时保持真实和对话性。"
-        )
-    st.session_state.chat = model.start_chat()
-    st.session_state.chat.send_message(system_prompt)
+    # The persona is built into the model, so starting a session costs no LLM call
+    st.session_state.chat = get_persona_model(*current_profile())
 
-# 8. Initialize chat history storage
+# 8. Initialize chat history storage (persisted under the session token in the URL)
+if not session_token:
+    session_token = new_token()
+    st.query_params["session"] = session_token
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = new_transcript(session_token)
+# The simulated person opens a new session, served from the warm pool when an opener is ready
+if OPENING_TURN and not len(st.session_state.messages) and "opening_tried" not in st.session_state:
+    st.session_state["opening_tried"] = True
+    profile = current_profile()
+    opening = get_warm_pool().take(profile)
+    if opening is None:
+        try:
+            with st.spinner():
+                opening = generate_opening(profile)
+        except Exception:
+            # The user can still start the conversation themselves
+            opening = None
+    if opening and opening[0]:
+        st.session_state.messages.append("assistant", *opening)
+settings = {key: st.session_state[key] for key in SETTINGS_KEYS if key in st.session_state}
+if settings != st.session_state.get("persisted_settings"):
+    session_store.save_settings(session_token, settings)
+    st.session_state["persisted_settings"] = settings
+if "context" not in st.session_state:
+    st.session_state.context = ConversationContext(CONTEXT_TOKEN_BUDGET, CONTEXT_RECENT_TURNS)
+rerun_timer.lap("session")
 
 # 9. Page header and instructions
 st.title("🛡️ MirrorShield" if st.session_state.get("language_select", "English") == "English" else "🛡️ 镜盾")
+# With an opening turn the simulated person has already spoken first
+opened_by_bot = len(st.session_state.messages) and st.session_state.messages[0]["role"] == "assistant"
 st.markdown(
-    """
+    f"""
 This interactive simulation helps you recognize and understand manipulative behaviors 
 associated with narcissistic personality disorder (NPD).
 
-Type a message below to start the conversation.
+{"Reply to their message below to continue the conversation." if opened_by_bot else "Type a message below to start the conversation."}
 """ if st.session_state.get("language_select", "English") == "English" else
-    """
+    f"""
 本互动模拟帮助你识别和理解与自恋型人格障碍（NPD）相关的操控行为。
 
-在下方输入消息，开始对话。
+{"在下方回复对方的消息，继续对话。" if opened_by_bot else "在下方输入消息，开始对话。"}
 """
 )
 
 # 10. Render existing messages
-for idx, msg in enumerate(st.session_state.messages):
+# A guess or reveal reruns only that message's fragment, not the whole script
+@st.fragment
+def render_guess(idx: int, tactic: str):
+    """
+    Guessing widgets for one assistant message.
+    """
+    guess_key = f"guess_tactic_{idx}"
+    show_key = f"show_tactic_{idx}"
+    msg = st.session_state.messages[idx]
+    lang = st.session_state.get("language_select", "English")
+    # If not guessed yet, show radio and button
+    if msg.guess is None:
+        guess_area = st.empty()
+        with guess_area.container():
+            selected_signs = st.session_state.get("signs_select", ["Gaslighting", "Love bombing", "Blame-shifting"])
+            guess = st.radio(
+                "Guess the tactic used:" if lang == "English" else "请猜测使用的特征：",
+                selected_signs + ["None"],
+                key=f"radio_{guess_key}"
+            )
+            submitted = st.button("Submit Guess" if lang == "English" else "提交猜测", key=f"submit_{guess_key}")
+        if not submitted:
+            return
+        st.session_state.messages.set_guess(idx, guess)
+        guess_area.empty()
+    # After guess, show toggle to reveal
+    col1, col2 = st.columns([2,1])
+    with col1:
+        st.markdown((f"**Your guess:** {msg.guess}" if lang == "English" else f"**你的猜测：** {msg.guess}"))
+    with col2:
+        show = st.toggle("Show tactic" if lang == "English" else "显示特征", value=msg.show_tactic, key=show_key)
+        if show != msg.show_tactic:
+            st.session_state.messages.set_show_tactic(idx, show)
+    if msg.show_tactic:
+        st.info((f"Tactic: {tactic}" if lang == "English" else f"特征：{tactic}"))
+        # Optionally, show if guess was correct
+        if is_unknown_tactic(tactic):
+            st.caption("This reply did not name a recognizable tactic, so your guess is not scored." if lang == "English"
+                       else "这条回复没有给出可识别的特征，因此本次猜测不计分。")
+        elif msg.guess == tactic:
+            st.success("Correct!" if lang == "English" else "猜对了！")
+        else:
+            st.error("Incorrect." if lang == "English" else "不正确。")
+
+
+def render_archived(msg: Message):
+    """
+    Widget-free rendering of an older message for the collapsed archive.
+    """
+    lang = st.session_state.get("language_select", "English")
+    guess = msg.guess
+    st.markdown(f"**{'You' if msg['role'] == 'user' else 'NPD'}:** {msg['content']}" if lang == "English" else
+                f"**{'你' if msg['role'] == 'user' else 'NPD'}：** {msg['content']}")
+    if msg["role"] == "assistant" and msg.get("tactic") and guess is not None:
+        verdict = "" if is_unknown_tactic(msg["tactic"]) else "✅" if guess == msg["tactic"] else "❌"
+        st.caption((f"Your guess: {guess} · Tactic: {msg['tactic']} {verdict}" if lang == "English" else
+                    f"你的猜测：{guess} · 特征：{msg['tactic']} {verdict}"))
+
+
+# Only the most recent turns are rendered with widgets; older ones collapse into a lazy archive
+recent_start = max(0, len(st.session_state.messages) - 2 * HISTORY_RECENT_TURNS)
+if recent_start:
+    lang = st.session_state.get("language_select", "English")
+    if st.toggle(
+        f"Show {recent_start} earlier messages" if lang == "English" else f"显示更早的 {recent_start} 条消息",
+        key="show_history_archive"
+    ):
+        with st.container(border=True):
+            for idx in range(recent_start):
+                render_archived(st.session_state.messages[idx])
+for idx in range(recent_start, len(st.session_state.messages)):
+    msg = st.session_state.messages[idx]
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
         if msg["role"] == "assistant" and msg.get("tactic"):
             # Guessing logic
-            guess_key = f"guess_tactic_{idx}"
-            show_key = f"show_tactic_{idx}"
-            if "guesses" not in st.session_state:
-                st.session_state["guesses"] = {}
-            if "show_tactics" not in st.session_state:
-                st.session_state["show_tactics"] = {}
-            lang = st.session_state.get("language_select", "English")
-            selected_signs = st.session_state.get("signs_select", ["Gaslighting", "Love bombing", "Blame-shifting"])
-            options = selected_signs + ["None"]
-            # If not guessed yet, show radio and button
-            if guess_key not in st.session_state["guesses"]:
-                guess = st.radio(
-                    "Guess the tactic used:" if lang == "English" else "请猜测使用的特征：",
-                    options,
-                    key=f"radio_{guess_key}"
-                )
-                if st.button("Submit Guess" if lang == "English" else "提交猜测", key=f"submit_{guess_key}"):
-                    st.session_state["guesses"][guess_key] = guess
-                    st.rerun()
-            else:
-                # After guess, show toggle to reveal
-                col1, col2 = st.columns([2,1])
-                with col1:
-                    st.markdown((f"**Your guess:** {st.session_state['guesses'][guess_key]}" if lang == "English" else f"**你的猜测：** {st.session_state['guesses'][guess_key]}"))
-                with col2:
-                    show = st.toggle("Show tactic" if lang == "English" else "显示特征", key=show_key)
-                    st.session_state["show_tactics"][show_key] = show
-                if st.session_state["show_tactics"].get(show_key, False):
-                    st.info((f"Tactic: {msg['tactic']}" if lang == "English" else f"特征：{msg['tactic']}"))
-                    # Optionally, show if guess was correct
-                    if st.session_state['guesses'][guess_key] == msg['tactic']:
-                        st.success("Correct!" if lang == "English" else "猜对了！")
-                    else:
-                        st.error("Incorrect." if lang == "English" else "不正确。")
+            render_guess(idx, msg["tactic"])
+rerun_timer.lap("history")
 
 # 11. Handle new user input
 user_input = st.chat_input("Type your message here..." if st.session_state.get("language_select", "English") == "English" else "在此输入你的消息……")
 if user_input:
-    # a) Display & save the user's message
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    # a) Display & save the user's message (earlier turns go into the prompt context first)
+    lang = st.session_state.get("language_select", "English")
+    history = st.session_state.context.build(st.session_state.messages, lang)
+    st.session_state.messages.append("user", user_input)
     with st.chat_message("user"):
         st.markdown(user_input)
 
     # b) Send the user message to Gemini (structured tool call)
     try:
         selected_signs = st.session_state.get("signs_select", ["Gaslighting", "Love bombing", "Blame-shifting"])
-        lang = st.session_state.get("language_select", "English")
-        prompt = build_chat_prompt(user_input, selected_signs, lang)
-        response = model.generate_content(prompt)
-        assistant_text = response.text
-        reply, tactic = parse_response(assistant_text)
-        st.session_state.messages.append({"role": "assistant", "content": reply, "tactic": tactic})
+        # Structured mode asks for JSON; either format is parsed, validated and repaired locally below
+        build_prompt = build_structured_chat_prompt if STRUCTURED_CHAT else build_chat_prompt
+        prompt = build_prompt(user_input, selected_signs, lang, history)
+        cache_key = make_cache_key(st.session_state.chat.full_prompt(prompt), MODEL, lang)
+        cached_text = response_cache.get(cache_key)
         with st.chat_message("assistant"):
-            st.markdown(reply)
+            reply_placeholder = st.empty()
+            reply = None
+            if cached_text is not None:
+                reply, tactic = parse_structured_response(cached_text, selected_signs, lang)
+            elif STREAM_CHAT:
+                # Render the reply as chunks arrive; the tactic is parsed from the same stream
+                try:
+                    stream = StructuredReplyStream(
+                        iter_response_text(st.session_state.chat.generate_content(prompt, stream=True, hedge=True)),
+                        selected_signs,
+                        lang,
+                    )
+                    for partial_reply in stream:
+                        reply_placeholder.markdown(partial_reply + " ▌")
+                    reply, tactic = stream.result()
+                    response_cache.set(cache_key, stream.text)
+                except Exception:
+                    reply = None
+            if reply is None:
+                # Blocking fallback when streaming is disabled or failed
+                response = st.session_state.chat.generate_content(prompt, hedge=True)
+                reply, tactic = parse_structured_response(response.text, selected_signs, lang)
+                response_cache.set(cache_key, response.text)
+            reply_placeholder.markdown(reply)
+            idx = st.session_state.messages.append("assistant", reply, tactic)
             # Tactic reveal button
-            tactic_key = f"show_tactic_{len(st.session_state.messages) - 1}"
-            if "revealed_tactics" not in st.session_state:
-                st.session_state["revealed_tactics"] = set()
-            if tactic_key not in st.session_state["revealed_tactics"]:
+            tactic_key = f"show_tactic_{idx}"
+            if not st.session_state.messages[idx].revealed:
                 if st.button("Show tactic" if lang == "English" else "显示特征", key=tactic_key):
-                    st.session_state["revealed_tactics"].add(tactic_key)
+                    st.session_state.messages.set_revealed(idx)
                     st.rerun()
-            if tactic_key in st.session_state["revealed_tactics"]:
+            if st.session_state.messages[idx].revealed:
                 st.info((f"Tactic: {tactic}" if lang == "English" else f"特征：{tactic}"))
     except Exception as e:
         st.error(("An error occurred: " if st.session_state.get("language_select", "English") == "English" else "发生错误：") + str(e))
-        if "quota" in str(e).lower():
+        if is_quota_error(e):
             st.error("API quota exceeded. Please check your API key limits." if st.session_state.get("language_select", "English") == "English" else "API额度已用尽。请检查你的API密钥限制。")
+        elif isinstance(e, (CircuitOpenError, AdmissionTimeoutError)):
+            st.error("The AI service is temporarily unavailable. Please try again shortly." if st.session_state.get("language_select", "English") == "English" else "AI服务暂时不可用，请稍后再试。")
+    rerun_timer.lap("chat_turn")
+rerun_timer.finish("chat")
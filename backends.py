@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# Canned replies per English tactic name (as in utils.sign_map)
+SYNTHETIC_REPLIES = {
+    "Gaslighting": {
+        "English": [
+            "That never happened. You're remembering it wrong again.",
+            "You're being way too sensitive, I was obviously joking.",
+            "I never said that. Are you sure you're feeling okay?",
+        ],
+        "中文": [
+            "根本没发生过这种事，你又记错了。",
+            "你太敏感了，我明明是在开玩笑。",
+            "我从来没说过那句话，你确定你没事吗？",
+        ],
+    },
+    "Love bombing": {
+        "English": [
+            "Nobody has ever understood me the way you do. You're perfect.",
+            "I've never felt this way about anyone. Let's move in together.",
+            "You're the most amazing person I've ever met, I can't stop thinking about you.",
+        ],
+        "中文": [
+            "从来没有人像你这样懂我，你太完美了。",
+            "我从没对任何人有过这种感觉，我们搬到一起住吧。",
+            "你是我见过最好的人，我满脑子都是你。",
+        ],
+    },
+    "Blame-shifting": {
+        "English": [
+            "If you hadn't upset me, I wouldn't have reacted like that.",
+            "This is your fault, you always start these fights.",
+            "I only did it because you pushed me into it.",
+        ],
+        "中文": [
+            "要不是你惹我生气，我也不会那样。",
+            "这都怪你，每次吵架都是你先挑起来的。",
+            "我这么做还不是被你逼的。",
+        ],
+    },
+}
+
+
+class CassetteMissError(LookupError):
+    """
+    Raised by the replay backend when a prompt was never recorded.
+    """
+
+
+class TextResponse:
+    """
+    Minimal stand-in for a Gemini response: .text, and iteration over chunks when streamed.
+    """
+
+    def __init__(self, text: str, chunks: list = None, chunk_delay: float = 0.0):
+        self.text = text
+        self._chunks = chunks if chunks is not None else [text]
+        self._chunk_delay = chunk_delay
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield TextResponse(chunk)
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def split_chunks(text: str, size: int = 16) -> list:
+    """
+    Split text into roughly token-sized chunks for simulated streaming.
+    """
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def create_live_model(model_name: str, api_key: str):
+    """
+    Build the real Gemini model (imports the SDK on demand).
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name=model_name)
+
+
+class RecordingBackend:
+    """
+    Pass calls through to a live model and append each prompt/response pair to a JSONL cassette.
+    """
+
+    def __init__(self, inner, cassette_path: str):
+        self.inner = inner
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        response = self.inner.generate_content(prompt, stream=stream, **kwargs)
+        if not stream:
+            self._record(prompt, response.text, None)
+            return response
+        return self._record_stream(prompt, response)
+
+    def _record_stream(self, prompt: str, response):
+        chunks = []
+        for chunk in response:
+            chunks.append(chunk.text)
+            yield chunk
+        self._record(prompt, "".join(chunks), chunks)
+
+    def _record(self, prompt: str, text: str, chunks):
+        entry = {"key": prompt_key(prompt), "prompt": prompt, "text": text, "chunks": chunks}
+        with self._lock:
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class ReplayBackend:
+    """
+    Serve recorded responses from a JSONL cassette with simulated latency.
+
+    latency is slept before every response; chunk_delay between streamed chunks.
+    The last recording of a prompt wins.
+    """
+
+    def __init__(self, cassette_path: str, latency: float = 0.0, chunk_delay: float = 0.0):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self._entries = {}
+        with open(cassette_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        entry = self._entries.get(prompt_key(prompt))
+        if entry is None:
+            raise CassetteMissError("Prompt not found in cassette; record it first with MIRRORSHIELD_BACKEND=record.")
+        if self.latency:
+            time.sleep(self.latency)
+        chunks = entry.get("chunks") or split_chunks(entry["text"])
+        return TextResponse(entry["text"], chunks, self.chunk_delay if stream else 0.0)
+
+
+class SyntheticBackend:
+    """
+    Deterministic offline generator that emits well-formed replies without any network.
+
+    Chat prompts get "Reply: ...\\nTactic: ..." (or the JSON object that structured
+    prompts ask for) using one of the tactics offered in the prompt; analysis
+    prompts get an "NPD Traits Analysis: X%" line. The same prompt always yields
+    the same text. tactics is a list of (English, Chinese) name pairs like
+    utils.sign_map.
+    """
+
+    def __init__(self, tactics: list, latency: float = 0.0, chunk_delay: float = 0.0):
+        self.tactics = tactics
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        text = self.respond(prompt)
+        return TextResponse(text, split_chunks(text), self.chunk_delay if stream else 0.0)
+
+    def respond(self, prompt: str) -> str:
+        seed = int(prompt_key(prompt)[:8], 16)
+        chinese = "用户" in prompt or "请分析" in prompt or "你正在模拟" in prompt
+        lang = "中文" if chinese else "English"
+        if "NPD Traits Analysis" in prompt or "NPD特征分析" in prompt:
+            score = seed % 101
+            if chinese:
+                return f"NPD特征分析：{score}%\n（离线合成结果）该对话中出现了若干操控性表达。"
+            return f"NPD Traits Analysis: {score}%\n(Synthetic offline result) The conversation shows some manipulative phrasing."
+        offered = _offered_tactics(prompt) or [name if lang == "English" else zh for name, zh in self.tactics]
+        offered = offered or list(SYNTHETIC_REPLIES)
+        tactic = offered[seed % len(offered)]
+        canonical = next((name for name, zh in self.tactics if tactic in (name, zh)), None)
+        replies = SYNTHETIC_REPLIES.get(canonical, SYNTHETIC_REPLIES["Gaslighting"])[lang]
+        reply = replies[(seed // 7) % len(replies)]
+        if "JSON schema" in prompt:
+            return json.dumps({"reply": reply, "tactic": tactic}, ensure_ascii=False)
+        return f"Reply: {reply}\nTactic: {tactic}"
+
+
+def _offered_tactics(prompt: str) -> list:
+    match = re.search(r"choose from: (.*?)\)", prompt) or re.search(r"从：(.*?) 里选", prompt)
+    if not match:
+        return []
+    return [t.strip() for t in match.group(1).split(",") if t.strip()]
+
+
+def create_backend(name: str, model_name: str, api_key: str = None, cassette_path: str = None,
+                   latency: float = 0.0, chunk_delay: float = 0.0, tactics: list = None):
+    """
+    Build the model backend selected by name: live, record, replay or synthetic.
+    """
+    if name == "synthetic":
+        return SyntheticBackend(tactics or [], latency, chunk_delay)
+    if name == "replay":
+        return ReplayBackend(cassette_path, latency, chunk_delay)
+    if name not in ("live", "record"):
+        raise ValueError(f"Unknown model backend {name!r}; expected live, record, replay or synthetic.")
+    if not api_key:
+        raise EnvironmentError("No API key found. Please set GOOGLE_API_KEY in .env.")
+    live = create_live_model(model_name, api_key)
+    if name == "record":
+        directory = os.path.dirname(os.path.abspath(cassette_path))
+        os.makedirs(directory, exist_ok=True)
+        return RecordingBackend(live, cassette_path)
+    return live
@@ -0,0 +1,270 @@
+"""
+Headless bulk transcript scoring.
+
+Reads a directory of .txt transcripts (one message per line) or a JSONL stream
+of {"id": ..., "text": ...} records, analyzes them with a bounded worker pool
+and appends one JSON result per transcript to the output file. The output file
+doubles as the checkpoint: re-running the same command skips transcripts that
+already have a result, so an interrupted run resumes where it stopped.
+
+    python batch_analyze.py transcripts/ -o scores.jsonl [--workers 4] [--lang auto]
+    cat transcripts.jsonl | python batch_analyze.py - -o scores.jsonl
+"""
+import argparse
+import contextvars
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from analysis import analyze_transcript, iter_decoded_lines
+from context import CJK_PATTERN
+
+
+def detect_lang(text: str) -> str:
+    """
+    Guess the prompt language from the share of CJK characters in a sample of the text.
+    """
+    sample = text[:2000]
+    if not sample:
+        return "English"
+    return "中文" if len(CJK_PATTERN.findall(sample)) / len(sample) > 0.1 else "English"
+
+
+def iter_inputs(source: str):
+    """
+    Yield (transcript_id, open_lines) pairs; open_lines() returns the transcript's lines.
+
+    source is a directory (every .txt file below it, id = relative path), a
+    JSONL file, or "-" for JSONL on stdin.
+    """
+    if source != "-" and os.path.isdir(source):
+        for directory, subdirs, files in os.walk(source):
+            subdirs.sort()
+            for name in sorted(files):
+                if name.endswith(".txt"):
+                    path = os.path.join(directory, name)
+                    yield os.path.relpath(path, source), lambda path=path: _read_lines(path)
+        return
+    stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            transcript_id = str(line_no)
+            try:
+                record = json.loads(line)
+                transcript_id = str(record.get("id", line_no))
+                text = record["text"]
+            except (ValueError, KeyError, AttributeError) as e:
+                # A bad record becomes that id's error result instead of stopping the run
+                error = ValueError(f"invalid record on line {line_no}: {type(e).__name__}: {e}")
+                yield transcript_id, lambda error=error: _raise(error)
+                continue
+            yield transcript_id, lambda text=text: text.splitlines()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _raise(error: Exception):
+    raise error
+
+
+def _read_lines(path: str) -> list:
+    with open(path, "rb") as f:
+        return list(iter_decoded_lines(f))
+
+
+def load_checkpoint(output_path: str, retry_errors: bool = False) -> set:
+    """
+    Return the ids that already have a result in output_path (failed ones too unless retry_errors).
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted write; that transcript is redone
+                continue
+            if retry_errors and record.get("error"):
+                continue
+            done.add(record["id"])
+    return done
+
+
+def _terminate_partial_line(output_path: str):
+    # An interrupted write can leave half a record; start the next one on a fresh line
+    if not os.path.exists(output_path) or not os.path.getsize(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def analyze_one(transcript_id: str, open_lines, lang: str, generate, radar=None, radar_low: float = 0,
+                radar_high: float = 80, radar_min_lines: int = 20, radar_min_hits: int = 5,
+                **analysis_options) -> dict:
+    """
+    Analyze one transcript and return its result record; errors are recorded, not raised.
+
+    Transcripts triaged by the radar get a radar_score instead of a model score.
+    """
+    start = time.perf_counter()
+    record = {"id": transcript_id}
+    try:
+        lines = open_lines()
+        transcript_lang = detect_lang("\n".join(lines[:50])) if lang == "auto" else lang
+        record["lang"] = transcript_lang
+        report = radar.scan(lines) if radar is not None else None
+        if report is not None and report.verdict(radar_low, radar_high, radar_min_lines, radar_min_hits) != "uncertain":
+            # Clear-cut transcripts are triaged by the local radar without a model call
+            record.update({"score": None, "radar_score": report.score, "analysis": "", "windows": 0, "source": "radar"})
+        else:
+            record.update(analyze_transcript(
+                lines, transcript_lang, lambda prompt: generate(prompt, transcript_lang), **analysis_options
+            ))
+            record["source"] = "model"
+        if report is not None:
+            record["red_flags"] = report.counts
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(inputs, output_path: str, generate, lang: str = "auto", workers: int = 4,
+              retry_errors: bool = False, radar=None, radar_low: float = 0, radar_high: float = 80,
+              radar_min_lines: int = 20, radar_min_hits: int = 5, on_result=None, **analysis_options) -> dict:
+    """
+    Analyze (id, open_lines) inputs with at most workers transcripts in flight.
+
+    generate(prompt, lang) must return the model's response text. Results are
+    appended to output_path and flushed as each transcript finishes; ids
+    already there are skipped. Returns counts of analyzed, skipped and failed
+    transcripts.
+    """
+    done = load_checkpoint(output_path, retry_errors)
+    summary = {"analyzed": 0, "skipped": 0, "failed": 0}
+    _terminate_partial_line(output_path)
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        def collect(futures):
+            for future in futures:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                summary["failed" if "error" in record else "analyzed"] += 1
+                if on_result:
+                    on_result(record)
+
+        try:
+            for transcript_id, open_lines in inputs:
+                if transcript_id in done:
+                    summary["skipped"] += 1
+                    continue
+                done.add(transcript_id)
+                # Bounded submission: inputs are read lazily, never all at once
+                if len(pending) >= 2 * workers:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                # Workers run in a copy of the caller's context, so its scheduler session applies
+                pending.add(pool.submit(
+                    contextvars.copy_context().run, analyze_one, transcript_id, open_lines, lang, generate, radar,
+                    radar_low, radar_high, radar_min_lines, radar_min_hits, **analysis_options
+                ))
+            finished, pending = wait(pending)
+            collect(finished)
+        except BaseException as e:
+            # Keep what finished; unstarted transcripts are picked up by the next run
+            for future in pending:
+                future.cancel()
+            if not isinstance(e, KeyboardInterrupt):
+                # Transcripts already running are paid for; let them finish and record them
+                wait(pending)
+            collect(f for f in pending if f.done() and not f.cancelled())
+            raise
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Score transcripts for NPD traits in bulk.")
+    parser.add_argument("source", help="directory of .txt files, a JSONL file, or - for JSONL on stdin")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file (also the resume checkpoint)")
+    parser.add_argument("--lang", default="auto", choices=["auto", "English", "中文"], help="prompt language")
+    parser.add_argument("--workers", type=int, default=4, help="transcripts analyzed concurrently")
+    parser.add_argument("--retry-errors", action="store_true", help="redo transcripts whose earlier result failed")
+    parser.add_argument("--radar-triage", action="store_true",
+                        help="let the local red-flag radar triage clear-cut transcripts instead of the model "
+                             "(they get a radar_score, not a score; see MIRRORSHIELD_RADAR_*)")
+    args = parser.parse_args(argv)
+
+    # Deferred so --help works without the app configuration
+    from cache import ResponseCache, make_cache_key
+    from metrics import write_metrics_file
+    from radar import Radar
+    from scheduler import set_session
+    from utils import (
+        MODEL, get_client, CACHE_PATH, CACHE_TTL, CACHE_SIZE, CACHE_DISK_SIZE,
+        ANALYSIS_WINDOW_CHARS, ANALYSIS_OVERLAP_LINES, ANALYSIS_WORKERS, RADAR_LOW, RADAR_HIGH,
+        RADAR_MIN_LINES, RADAR_MIN_HITS, METRICS_FILE,
+    )
+
+    set_session("batch")
+    cache = ResponseCache(CACHE_PATH or None, max_entries=CACHE_SIZE, ttl=CACHE_TTL, disk_max_entries=CACHE_DISK_SIZE)
+
+    def generate(prompt: str, lang: str) -> str:
+        key = make_cache_key(prompt, MODEL, lang)
+        text = cache.get(key)
+        if text is None:
+            text = get_client().generate_content(prompt).text
+            cache.set(key, text)
+        return text
+
+    def report(record: dict):
+        if record.get("error"):
+            status = record["error"]
+        elif record.get("score") is not None:
+            status = f"{record['score']:.0f}%"
+        elif record.get("radar_score") is not None:
+            status = f"radar {record['radar_score']}/100"
+        else:
+            status = "no score"
+        print(f"{record['id']}: {status}", file=sys.stderr)
+
+    try:
+        summary = run_batch(
+            iter_inputs(args.source),
+            args.output,
+            generate,
+            lang=args.lang,
+            workers=args.workers,
+            retry_errors=args.retry_errors,
+            radar=Radar() if args.radar_triage else None,
+            radar_low=RADAR_LOW,
+            radar_high=RADAR_HIGH,
+            radar_min_lines=RADAR_MIN_LINES,
+            radar_min_hits=RADAR_MIN_HITS,
+            on_result=report,
+            max_chars=ANALYSIS_WINDOW_CHARS,
+            overlap_lines=ANALYSIS_OVERLAP_LINES,
+            max_workers=ANALYSIS_WORKERS,
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        return 130
+    finally:
+        if METRICS_FILE:
+            write_metrics_file(METRICS_FILE)
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
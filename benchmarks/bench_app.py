@@ -0,0 +1,289 @@
+"""
+End-to-end app benchmark: scripted sessions through Streamlit's AppTest harness against the synthetic model.
+
+The scenario changes settings, analyzes a large pasted transcript, continues
+to the chat and plays N turns (send a message, rerender, guess the tactic,
+reveal it). It records rerun latency for each kind of interaction, render
+time as the history grows, peak traced memory and model call counts, then
+compares them with the stored baselines and exits with status 1 on a
+regression. Each pass runs in a fresh interpreter with a deterministic
+environment, so no network, API key, disk cache or warm pool is involved.
+
+    python benchmarks/bench_app.py [--turns 40] [--analysis-lines 4000] [--json]
+    python benchmarks/bench_app.py --update-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines.json")
+
+# Pinned so a run only depends on the code under test, not on the caller's .env
+BENCH_ENV = {
+    "MIRRORSHIELD_BACKEND": "synthetic",
+    "GOOGLE_API_KEY": "",
+    "MIRRORSHIELD_BACKEND_LATENCY": "0",
+    "MIRRORSHIELD_BACKEND_CHUNK_DELAY": "0",
+    "MIRRORSHIELD_CACHE_PATH": "",
+    "MIRRORSHIELD_SESSION_DB": "",
+    "MIRRORSHIELD_WARM_POOL_SIZE": "0",
+    # The API rate limit would otherwise dominate every timing after the first burst
+    "MIRRORSHIELD_RATE_LIMIT_RPM": "1000000",
+    "MIRRORSHIELD_RATE_LIMIT_BURST": "1000",
+    "MIRRORSHIELD_RADAR_TRIAGE": "0",
+    "MIRRORSHIELD_METRICS_PORT": "",
+    "MIRRORSHIELD_METRICS_FILE": "",
+    "MIRRORSHIELD_PROFILE_SAMPLE_RATE": "0",
+}
+
+# How each compared metric may move before it counts as a regression: (kind, ratio, absolute slack)
+TOLERANCES = {
+    "time": (1.5, 0.01),
+    "memory": (1.25, 1.0),
+    "calls": (1.0, 0),
+}
+COMPARED = {
+    "first_render_s": "time",
+    "settings_rerun_s": "time",
+    "analysis_s": "time",
+    "continue_s": "time",
+    "chat_turn_s": "time",
+    "chat_turn_p95_s": "time",
+    "render_first_s": "time",
+    "render_last_s": "time",
+    "guess_s": "time",
+    "toggle_s": "time",
+    "peak_memory_mb": "memory",
+    "analysis_calls": "calls",
+    "continue_calls": "calls",
+    "chat_calls": "calls",
+}
+
+LINES = [
+    "A: You're imagining things again, that never happened.",
+    "B: I remember it clearly, you said it in front of everyone.",
+    "A: You're too sensitive. Nobody else would be upset about this.",
+    "B: Can we talk about what happened on Friday?",
+    "A: After everything I've done for you, this is how you treat me?",
+    "B: 我只是想把事情说清楚。",
+]
+
+
+def sample_transcript(lines: int) -> str:
+    return "\n".join(f"{LINES[i % len(LINES)]} ({i})" for i in range(lines))
+
+
+def timed_run(element_or_app) -> float:
+    start = time.perf_counter()
+    element_or_app.run()
+    return time.perf_counter() - start
+
+
+def run_scenario(turns: int, analysis_lines: int) -> dict:
+    """
+    Drive app.py through the scripted session in this process and return raw measurements.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    import utils
+
+    model = utils.get_client().model
+
+    def checked(at):
+        assert not at.exception, at.exception
+        return at
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    results = {"first_render_s": timed_run(at)}
+    checked(at)
+
+    # Settings page: change intensity and signs, then analyze a large pasted transcript
+    settings_times = [
+        timed_run(at.selectbox(key="intensity_select").set_value("High")),
+        timed_run(at.multiselect(key="signs_select").set_value(["Gaslighting", "Blame-shifting"])),
+    ]
+    checked(at)
+    at.text_area(key="settings_analyze_input").set_value(sample_transcript(analysis_lines))
+    settings_times.append(timed_run(at))
+    checked(at)
+    results["settings_rerun_s"] = statistics.median(settings_times)
+    calls = model.calls
+    results["analysis_s"] = timed_run(at.button(key="settings_run_analysis").click())
+    checked(at)
+    assert any("NPD Traits Analysis" in m.value for m in at.markdown), "analysis result missing"
+    results["analysis_calls"] = model.calls - calls
+
+    # Continue to the chat
+    at.text_area(key="settings_analyze_input").set_value("")
+    at.run()
+    calls = model.calls
+    results["continue_s"] = timed_run(at.button(key="center_continue").click())
+    checked(at)
+    assert at.session_state["settings_done"] and at.chat_input, "chat page missing after Continue"
+    results["continue_calls"] = model.calls - calls
+
+    calls = model.calls
+    per_turn = []
+    for turn in range(turns):
+        chat_turn = timed_run(at.chat_input[0].set_value(f"Why did you say that? ({turn})"))
+        checked(at)
+        messages = at.session_state["messages"]
+        idx = len(messages) - 1
+        # A plain rerun renders the whole history, now with the new reply's guessing widgets
+        render = timed_run(at)
+        checked(at)
+        at.radio(key=f"radio_guess_tactic_{idx}").set_value("Gaslighting")
+        guess = timed_run(at.button(key=f"submit_guess_tactic_{idx}").click())
+        checked(at)
+        toggle = timed_run(at.toggle(key=f"show_tactic_{idx}").set_value(True))
+        checked(at)
+        per_turn.append({
+            "messages": len(messages),
+            "chat_turn_s": chat_turn,
+            "render_s": render,
+            "guess_s": guess,
+            "toggle_s": toggle,
+        })
+    results["chat_calls"] = model.calls - calls
+    results["per_turn"] = per_turn
+    results["llm_calls"] = model.calls
+    return results
+
+
+def summarize(raw: dict) -> dict:
+    """
+    Reduce raw scenario measurements to the compared metrics (medians over turns).
+    """
+    per_turn = raw["per_turn"]
+    summary = {k: v for k, v in raw.items() if k != "per_turn"}
+    if per_turn:
+        chat_times = sorted(t["chat_turn_s"] for t in per_turn)
+        window = max(1, min(5, len(per_turn) // 4))
+        summary.update({
+            "chat_turn_s": statistics.median(chat_times),
+            "chat_turn_p95_s": chat_times[min(len(chat_times) - 1, int(0.95 * len(chat_times)))],
+            "render_first_s": statistics.median(t["render_s"] for t in per_turn[:window]),
+            "render_last_s": statistics.median(t["render_s"] for t in per_turn[-window:]),
+            "guess_s": statistics.median(t["guess_s"] for t in per_turn),
+            "toggle_s": statistics.median(t["toggle_s"] for t in per_turn),
+            "render_by_history": [(t["messages"], round(t["render_s"], 4)) for t in per_turn],
+        })
+    return summary
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """
+    Return a description of every compared metric that regressed beyond its tolerance.
+    """
+    regressions = []
+    for metric, kind in COMPARED.items():
+        if metric not in baseline or metric not in results:
+            continue
+        ratio, slack = TOLERANCES[kind]
+        limit = baseline[metric] * ratio + slack
+        if results[metric] > limit:
+            regressions.append(f"{metric}: {results[metric]:.4g} > {limit:.4g} (baseline {baseline[metric]:.4g})")
+    return regressions
+
+
+def run_pass(turns: int, analysis_lines: int, trace_memory: bool) -> dict:
+    """
+    Run the scenario in a fresh interpreter (optionally under tracemalloc) and return its summary.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, **BENCH_ENV, MIRRORSHIELD_SPILL_PATH=os.path.join(tmp, "spill.sqlite3"))
+        args = [sys.executable, os.path.abspath(__file__), "--worker", "--turns", str(turns),
+                "--analysis-lines", str(analysis_lines)]
+        if trace_memory:
+            args.append("--trace-memory")
+        out = subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True)
+    if out.returncode:
+        raise RuntimeError(f"benchmark pass failed:\n{out.stderr[-4000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(turns: int, analysis_lines: int) -> dict:
+    """
+    Timings come from an untraced pass; peak memory from a second pass under tracemalloc.
+    """
+    results = run_pass(turns, analysis_lines, trace_memory=False)
+    memory = run_pass(turns, analysis_lines, trace_memory=True)
+    results["peak_memory_mb"] = memory["peak_memory_mb"]
+    results["scenario"] = {"turns": turns, "analysis_lines": analysis_lines}
+    return results
+
+
+def worker(turns: int, analysis_lines: int, trace_memory: bool):
+    sys.path.insert(0, ROOT)
+    if trace_memory:
+        import tracemalloc
+
+        tracemalloc.start()
+    raw = run_scenario(turns, analysis_lines)
+    summary = summarize(raw)
+    if trace_memory:
+        summary["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    print(json.dumps(summary))
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, help="chat turns to play (default: the baseline's)")
+    parser.add_argument("--analysis-lines", type=int, help="lines in the analyzed transcript (default: the baseline's)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--trace-memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    scenario = baseline.get("scenario", {})
+    turns = args.turns if args.turns is not None else scenario.get("turns", 40)
+    analysis_lines = args.analysis_lines if args.analysis_lines is not None else scenario.get("analysis_lines", 4000)
+    if args.worker:
+        worker(turns, analysis_lines, args.trace_memory)
+        return 0
+
+    results = measure(turns, analysis_lines)
+    if args.update_baseline:
+        stored = {k: v for k, v in results.items() if k in COMPARED or k == "scenario"}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    # Baselines only apply to the scenario they were measured with
+    regressions = compare(results, baseline) if scenario == results["scenario"] else []
+    if args.json:
+        print(json.dumps(dict(results, regressions=regressions)))
+    else:
+        for metric in COMPARED:
+            if metric in results:
+                base = baseline.get(metric) if scenario == results["scenario"] else None
+                note = f"  (baseline {base:.4g})" if base is not None else ""
+                print(f"{metric:18} {results[metric]:10.4g}{note}")
+        print(f"{'llm_calls':18} {results['llm_calls']:10d}")
+        if baseline and scenario != results["scenario"]:
+            print("Scenario differs from the baseline's; nothing compared.")
+        for line in regressions:
+            print("REGRESSION " + line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Cold-start benchmark: import time of utils and time to first render of app.py.
+
+Each measurement runs in a fresh interpreter so module caches do not hide import
+cost. The app is rendered with the synthetic backend, so no network or API key
+is needed.
+
+    python benchmarks/bench_startup.py [--runs 5] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import utils
+elapsed = time.perf_counter() - start
+print(elapsed, "google.generativeai" in sys.modules)
+"""
+
+RENDER_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=60)
+at.run()
+elapsed = time.perf_counter() - start
+assert not at.exception, at.exception
+print(elapsed)
+"""
+
+
+def run_snippet(snippet: str) -> list:
+    env = dict(os.environ, MIRRORSHIELD_BACKEND="synthetic", MIRRORSHIELD_CACHE_PATH="")
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return out.stdout.split()
+
+
+def measure(runs: int) -> dict:
+    """
+    Return median import and first-render times (seconds) over runs fresh processes.
+    """
+    import_times = []
+    sdk_loaded = False
+    render_times = []
+    for _ in range(runs):
+        elapsed, loaded = run_snippet(IMPORT_SNIPPET)
+        import_times.append(float(elapsed))
+        sdk_loaded = sdk_loaded or loaded == "True"
+        render_times.append(float(run_snippet(RENDER_SNIPPET)[0]))
+    return {
+        "utils_import_s": statistics.median(import_times),
+        "first_render_s": statistics.median(render_times),
+        "sdk_imported_by_utils": sdk_loaded,
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    results = measure(args.runs)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"utils import:  {results['utils_import_s'] * 1000:.1f} ms (median of {args.runs})")
+    print(f"first render:  {results['first_render_s'] * 1000:.1f} ms (median of {args.runs})")
+    print(f"SDK imported by utils: {results['sdk_imported_by_utils']}")
+
+
+if __name__ == "__main__":
+    main()
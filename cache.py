@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so trivially different copies (whitespace, line endings,
+    Unicode composition) map to the same cache key.
+    """
+    text = unicodedata.normalize("NFC", prompt).replace("\r\n", "\n").replace("\r", "\n")
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.split("\n")]
+    return "\n".join(lines).strip()
+
+
+def make_cache_key(prompt: str, model_name: str, lang: str) -> str:
+    """
+    Build a content-addressed cache key from the normalized prompt, model name and language.
+    """
+    payload = "\x1f".join([model_name, lang, normalize_prompt(prompt)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU in front of an optional SQLite file.
+
+    Entries expire after ttl seconds in both tiers. The memory tier holds at most
+    max_entries items; the disk tier at most disk_max_entries, evicting the least
+    recently used rows. Pass path=None to keep the cache in memory only.
+    """
+
+    def __init__(self, path=None, max_entries: int = 256, ttl: float = 86400, disk_max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str):
+        """
+        Return the cached text for key, or None on a miss or expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created <= self.ttl:
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, created, value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """
+        Store text for key in both tiers.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,),
+                )
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters and current memory-tier size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._memory),
+            }
+
+    def _remember(self, key: str, created: float, value: str):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -0,0 +1,100 @@
+import math
+import re
+
+# CJK ideographs, punctuation and full-width forms: roughly one token per character
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate: one per CJK character, one per four other characters.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text so that it (plus an ellipsis) fits in max_tokens.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+
+def format_turn(msg: dict, lang: str) -> str:
+    if lang == "English":
+        speaker = "User" if msg["role"] == "user" else "You"
+        return f"{speaker}: {msg['content']}"
+    speaker = "用户" if msg["role"] == "user" else "你"
+    return f"{speaker}：{msg['content']}"
+
+
+class ConversationContext:
+    """
+    Token-budgeted chat history: recent turns verbatim, older turns in a running summary.
+
+    Messages leave the verbatim window once they are older than recent_turns
+    turns, or sooner if the window would exceed token_budget. Each one is folded
+    into the summary exactly once as a one-line digest, so updating costs
+    O(new messages). The summary keeps at most summary_share of the budget and
+    drops its oldest digests past that. build() therefore stays within budget
+    however long the conversation gets.
+    """
+
+    def __init__(self, token_budget: int = 600, recent_turns: int = 4, summary_share: float = 0.3,
+                 digest_tokens: int = 24):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_budget = int(token_budget * summary_share)
+        self.digest_tokens = digest_tokens
+        self.reset()
+
+    def reset(self):
+        self.summary = []
+        self.folded = 0
+        self.dropped = 0
+
+    def build(self, messages: list, lang: str) -> str:
+        """
+        Render the context block for messages (oldest first, excluding the new user input).
+        """
+        if len(messages) < self.folded:
+            # History was cleared (e.g. a new session); start over
+            self.reset()
+        self._fold_until(messages, max(self.folded, len(messages) - 2 * self.recent_turns), lang)
+        max_message_tokens = max(1, (self.token_budget - self.summary_budget) // 2)
+        while True:
+            recent = [truncate_to_tokens(format_turn(m, lang), max_message_tokens) for m in messages[self.folded:]]
+            text = self._render(recent, lang)
+            if estimate_tokens(text) <= self.token_budget or not recent:
+                return text
+            self._fold_until(messages, self.folded + 1, lang)
+
+    def _fold_until(self, messages: list, end: int, lang: str):
+        for msg in messages[self.folded:end]:
+            self.summary.append(truncate_to_tokens(format_turn(msg, lang), self.digest_tokens))
+            while self.summary and estimate_tokens("\n".join(self.summary)) > self.summary_budget:
+                self.summary.pop(0)
+                self.dropped += 1
+        self.folded = max(self.folded, end)
+
+    def _render(self, recent: list, lang: str) -> str:
+        parts = []
+        if self.summary or self.dropped:
+            lines = [f"- {line}" for line in self.summary]
+            if self.dropped:
+                lines.insert(0, f"- ({self.dropped} earlier messages omitted)" if lang == "English" else f"- （省略了更早的 {self.dropped} 条消息）")
+            parts.append(("Summary of earlier conversation:" if lang == "English" else "更早对话摘要：") + "\n" + "\n".join(lines))
+        if recent:
+            parts.append(("Recent messages:" if lang == "English" else "最近的消息：") + "\n" + "\n".join(recent))
+        return "\n\n".join(parts)
@@ -0,0 +1,408 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from context import estimate_tokens
+from metrics import registry
+from scheduler import AdmissionTimeoutError
+
+# HTTP status codes worth retrying (google.api_core exceptions expose them as .code)
+TRANSIENT_CODES = {429, 500, 502, 503, 504}
+RETRY_HINT_PATTERN = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+# Token counts are estimated locally (google-generativeai 0.3.x responses carry no usage metadata)
+LLM_CALL_SECONDS = registry.histogram(
+    "mirrorshield_llm_call_seconds",
+    "Model call latency including queueing and retries (time to first chunk for streams)",
+    ("mode", "outcome"),
+)
+LLM_STREAM_SECONDS = registry.histogram(
+    "mirrorshield_llm_stream_seconds", "Time from the first streamed chunk to the end of the response"
+)
+LLM_STREAM_STALLS = registry.counter(
+    "mirrorshield_llm_stream_stalls_total", "Streams abandoned because no chunk arrived within the deadline"
+)
+LLM_RETRIES = registry.counter("mirrorshield_llm_retries_total", "Model call attempts retried, by error class", ("error",))
+LLM_HEDGES = registry.counter("mirrorshield_llm_hedges_total", "Duplicate requests sent for slow calls")
+LLM_PROMPT_TOKENS = registry.counter("mirrorshield_llm_prompt_tokens_total", "Estimated prompt tokens requested", ("mode",))
+LLM_RESPONSE_TOKENS = registry.counter(
+    "mirrorshield_llm_response_tokens_total", "Estimated response tokens received", ("mode",)
+)
+
+
+class LLMTimeoutError(TimeoutError):
+    """
+    Raised when a model call does not finish within its deadline.
+    """
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised without calling the model while the circuit breaker is open.
+    """
+
+
+def is_quota_error(exc: Exception) -> bool:
+    """
+    True for rate-limit / quota errors (HTTP 429, ResourceExhausted).
+    """
+    return (
+        getattr(exc, "code", None) == 429
+        or type(exc).__name__ == "ResourceExhausted"
+        or "quota" in str(exc).lower()
+    )
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """
+    True for errors that may succeed on retry: timeouts, connection drops, 429 and 5xx.
+    """
+    if isinstance(exc, CircuitOpenError):
+        return False
+    return (
+        isinstance(exc, (TimeoutError, ConnectionError))
+        or getattr(exc, "code", None) in TRANSIENT_CODES
+        or is_quota_error(exc)
+    )
+
+
+def classify_error(exc: Exception) -> str:
+    """
+    Short error class for metrics and logs.
+    """
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, AdmissionTimeoutError):
+        return "admission_timeout"
+    if isinstance(exc, TimeoutError):
+        return "timeout"
+    if is_quota_error(exc):
+        return "quota"
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and 500 <= code < 600:
+        return "server"
+    if isinstance(exc, ConnectionError):
+        return "connection"
+    if isinstance(code, int) and 400 <= code < 500:
+        return "client"
+    return "other"
+
+
+def _response_text(response) -> str:
+    try:
+        return response.text or ""
+    except Exception:
+        # Blocked or empty candidates raise on .text
+        return ""
+
+
+_END = object()
+
+
+class _StreamStalled(Exception):
+    def __init__(self, future):
+        super().__init__()
+        self.future = future
+
+
+class MeasuredStream:
+    """
+    Iterator over a streamed response that records stream metrics.
+
+    With a pool, every chunk is read on a pool thread and must arrive within
+    chunk_timeout seconds; otherwise LLMTimeoutError is raised and the stalled
+    read is abandoned. release, if given, is called exactly once when the
+    stream is exhausted, fails, is closed or is garbage collected (after a
+    stall, once the abandoned read returns), so a scheduler slot covers the
+    whole time the upstream response is being read.
+    """
+
+    def __init__(self, response, release=None, pool=None, chunk_timeout: float = 30):
+        self._chunks = iter(response)
+        self._release = release
+        self._pool = pool
+        self.chunk_timeout = chunk_timeout
+        self._start = time.perf_counter()
+        self._tokens = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        try:
+            chunk = self._read()
+        except _StreamStalled as e:
+            LLM_STREAM_STALLS.inc()
+            self.close(after=e.future)
+            raise LLMTimeoutError(f"No streamed chunk within {self.chunk_timeout}s.") from None
+        except BaseException:
+            self.close()
+            raise
+        self._tokens += estimate_tokens(_response_text(chunk))
+        return chunk
+
+    def _read(self):
+        if self._pool is None:
+            return next(self._chunks)
+        future = self._pool.submit(next, self._chunks, _END)
+        try:
+            chunk = future.result(timeout=self.chunk_timeout)
+        except FutureTimeoutError:
+            if not future.done():
+                raise _StreamStalled(future)
+            raise
+        if chunk is _END:
+            raise StopIteration
+        return chunk
+
+    def close(self, after=None):
+        """
+        Stop reading; the slot is released now, or when the future after (a stalled read) completes.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        LLM_STREAM_SECONDS.observe(time.perf_counter() - self._start)
+        LLM_RESPONSE_TOKENS.inc(self._tokens, mode="stream")
+        if self._release is None:
+            return
+        if after is None:
+            self._release()
+        else:
+            after.add_done_callback(lambda _: self._release())
+
+    def __del__(self):
+        # A stream dropped without being read to the end must not keep its slot
+        self.close()
+
+
+class CircuitBreaker:
+    """
+    Fail fast after failure_threshold consecutive transient failures.
+
+    After reset_timeout seconds one probe call is let through; its outcome
+    closes the breaker again or re-opens it for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at < self.reset_timeout or self._probing:
+                raise CircuitOpenError("The model API is temporarily unavailable; failing fast.")
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+class ResilientClient:
+    """
+    Wrap a model with per-call deadlines, jittered exponential backoff and a circuit breaker.
+
+    Exposes the same generate_content(prompt, **kwargs) interface as the wrapped
+    model. Pass hedge=True to send a duplicate request when the first has not
+    answered within hedge_after seconds and use whichever returns first. A call
+    that misses its deadline is abandoned (the SDK cannot cancel it) and its
+    worker thread finishes in the background. Streams get the same deadline
+    for every chunk, so a stream that stalls midway raises LLMTimeoutError.
+
+    With a scheduler, every attempt waits for process-wide admission, the slot
+    is held until the upstream call really finishes (for streams, until the
+    returned MeasuredStream is exhausted or closed), hedges are only sent when
+    a slot is free right away, and identical non-streaming requests in flight
+    at the same time share one call.
+    """
+
+    def __init__(
+        self,
+        model,
+        timeout: float = 30,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8,
+        quota_base_delay: float = 2,
+        hedge_after: float = 4,
+        breaker: CircuitBreaker = None,
+        scheduler=None,
+        max_workers: int = 32,
+        sleep=time.sleep,
+        rng=random.random,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.quota_base_delay = quota_base_delay
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._sleep = sleep
+        self._rng = rng
+
+    def generate_content(self, prompt, hedge: bool = False, **kwargs):
+        mode = "stream" if kwargs.get("stream") else "blocking"
+        LLM_PROMPT_TOKENS.inc(estimate_tokens(prompt), mode=mode)
+        start = time.perf_counter()
+        try:
+            if self.scheduler is not None and mode == "blocking":
+                key = repr((prompt, sorted(kwargs.items())))
+                result = self.scheduler.single_flight(key, lambda: self._generate(prompt, hedge, kwargs))
+            else:
+                result = self._generate(prompt, hedge, kwargs)
+        except Exception as e:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - start, mode=mode, outcome=classify_error(e))
+            raise
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, mode=mode, outcome="ok")
+        if mode == "stream":
+            release = self.scheduler.release if self.scheduler is not None else None
+            return MeasuredStream(result, release, self._pool, self.timeout)
+        LLM_RESPONSE_TOKENS.inc(estimate_tokens(_response_text(result)), mode=mode)
+        return result
+
+    def _generate(self, prompt, hedge: bool, kwargs: dict):
+        for attempt in range(self.max_retries + 1):
+            if self.scheduler is not None:
+                self.scheduler.acquire()
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                if self.scheduler is not None:
+                    self.scheduler.release()
+                raise
+            try:
+                if hedge:
+                    result = self._hedged_call(prompt, kwargs)
+                else:
+                    result = self._call_with_deadline(prompt, kwargs)
+            except Exception as e:
+                if not is_transient_error(e):
+                    # The API answered (e.g. a 400), so it is not degraded
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                LLM_RETRIES.inc(error=classify_error(e))
+                self._sleep(self.backoff_delay(attempt, e))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def backoff_delay(self, attempt: int, exc: Exception) -> float:
+        """
+        Full-jitter exponential delay; quota errors start higher and honour "retry in Ns" hints.
+        """
+        base = self.quota_base_delay if is_quota_error(exc) else self.base_delay
+        delay = self._rng() * min(self.max_delay, base * (2 ** attempt))
+        hint = RETRY_HINT_PATTERN.search(str(exc))
+        if hint:
+            delay = max(delay, float(hint.group(1)))
+        return min(delay, self.max_delay)
+
+    def _submit(self, prompt, kwargs):
+        """
+        Start an upstream call; the caller must already hold a scheduler slot.
+        """
+        try:
+            future = self._pool.submit(self.model.generate_content, prompt, **kwargs)
+        except BaseException:
+            if self.scheduler is not None:
+                self.scheduler.release()
+            raise
+        if self.scheduler is not None:
+            if kwargs.get("stream"):
+                # A started stream keeps its slot until it has been read (see MeasuredStream)
+                future.add_done_callback(lambda f: self._release_unless_streaming(f))
+            else:
+                future.add_done_callback(lambda _: self.scheduler.release())
+        return future
+
+    def _release_unless_streaming(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.scheduler.release()
+
+    def _abandon(self, futures, kwargs):
+        """
+        Release the slots of streams that were started but will never be read (timed out or lost a hedge).
+        """
+        if self.scheduler is None or not kwargs.get("stream"):
+            return
+        for future in futures:
+            future.add_done_callback(
+                lambda f: self.scheduler.release() if not f.cancelled() and f.exception() is None else None
+            )
+
+    def _call_with_deadline(self, prompt, kwargs):
+        future = self._submit(prompt, kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError as e:
+            if future.done():
+                raise
+            self._abandon([future], kwargs)
+            raise LLMTimeoutError(f"Model call exceeded {self.timeout}s deadline.") from e
+
+    def _hedged_call(self, prompt, kwargs):
+        deadline = time.monotonic() + self.timeout
+        primary = self._submit(prompt, kwargs)
+        done, _ = wait([primary], timeout=min(self.hedge_after, self.timeout))
+        if done:
+            return primary.result()
+        futures = [primary]
+        if self.scheduler is None or self.scheduler.try_acquire():
+            futures.append(self._submit(prompt, kwargs))
+            LLM_HEDGES.inc()
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self._abandon([f for f in futures if f is not future], kwargs)
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        self._abandon(pending, kwargs)
+        raise LLMTimeoutError(f"Model call exceeded {self.timeout}s deadline.")
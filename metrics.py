@@ -0,0 +1,301 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from cache hits up to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), v) for key, v in sorted(self._values.items())]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels, as in the Prometheus data model.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the with-block, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            return entry[0][-1] if entry else 0
+
+    def samples(self) -> list:
+        out = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                labels = dict(zip(self.labelnames, key))
+                for bound, count in zip(self.buckets, counts):
+                    out.append((self.name + "_bucket", dict(labels, le=_format_value(bound)), count))
+                out.append((self.name + "_sum", labels, total))
+                out.append((self.name + "_count", labels, counts[-1]))
+        return out
+
+
+class MetricsRegistry:
+    """
+    Named metrics plus collectors that report point-in-time values (e.g. cache stats) when rendered.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collect):
+        """
+        collect() returns (name, type, help, [(labels, value), ...]) tuples, read at every render.
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collect in collectors:
+            try:
+                families = list(collect())
+            except Exception:
+                # A broken collector must not take down the whole scrape
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-imported modules (e.g. Streamlit reruns) get the same metric back
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+registry = MetricsRegistry()
+
+RERUN_SECONDS = registry.histogram(
+    "mirrorshield_rerun_seconds", "Duration of complete Streamlit script runs", ("page",)
+)
+SECTION_SECONDS = registry.histogram(
+    "mirrorshield_rerun_section_seconds", "Duration of sections of the Streamlit script", ("section",)
+)
+PROFILED_RUNS = registry.counter("mirrorshield_profiled_runs_total", "Script runs profiled with cProfile")
+
+
+class RerunTimer:
+    """
+    Time one script run: lap(section) records the time since the previous lap, finish(page) the whole run.
+
+    A sample_rate fraction of runs is also profiled with cProfile and written
+    to profile_dir as <page>-<timestamp>.pstats (open with python -m pstats).
+    """
+
+    _thread_state = threading.local()
+
+    def __init__(self, sample_rate: float = 0.0, profile_dir: str = "profiles", rng=random.random):
+        self.profile_dir = profile_dir
+        self._profiler = None
+        # A profiled run that never reached finish() (st.rerun, an exception) must not stay enabled
+        abandoned = getattr(self._thread_state, "profiler", None)
+        if abandoned is not None:
+            abandoned.disable()
+            self._thread_state.profiler = None
+        if sample_rate > 0 and rng() < sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiling tool is already active in this thread
+                pass
+            else:
+                self._profiler = self._thread_state.profiler = profiler
+        self._start = self._last = time.perf_counter()
+        self.finished = False
+
+    def lap(self, section: str):
+        now = time.perf_counter()
+        SECTION_SECONDS.observe(now - self._last, section=section)
+        self._last = now
+
+    def finish(self, page: str):
+        if self.finished:
+            return
+        self.finished = True
+        RERUN_SECONDS.observe(time.perf_counter() - self._start, page=page)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._thread_state.profiler = None
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self._profiler.dump_stats(os.path.join(self.profile_dir, f"{page}-{time.time():.6f}.pstats"))
+            PROFILED_RUNS.inc()
+
+
+def stats_collector(prefix: str, stats, counters: tuple = ()):
+    """
+    Collector exporting each numeric entry of stats() as <prefix>_<key>; keys in counters become <prefix>_<key>_total.
+    """
+    def collect():
+        families = []
+        for key, value in stats().items():
+            if not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                families.append((f"{prefix}_{key}_total", "counter", f"{key} since start", [({}, value)]))
+            else:
+                families.append((f"{prefix}_{key}", "gauge", f"current {key}", [({}, value)]))
+        return families
+
+    return collect
+
+
+def write_metrics_file(path: str, metrics_registry: MetricsRegistry = None):
+    """
+    Atomically write the current metrics to path (for node_exporter's textfile collector or scraping).
+    """
+    metrics_registry = metrics_registry or registry
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics_registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_file_exporter(path: str, interval: float = 15, metrics_registry: MetricsRegistry = None) -> threading.Thread:
+    """
+    Rewrite the metrics file every interval seconds from a daemon thread.
+    """
+    def run():
+        while True:
+            try:
+                write_metrics_file(path, metrics_registry)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_http_exporter(port: int, host: str = "127.0.0.1", metrics_registry: MetricsRegistry = None) -> ThreadingHTTPServer:
+    """
+    Serve the metrics at http://host:port/metrics from a daemon thread.
+    """
+    metrics_registry = metrics_registry or registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics_registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,161 @@
+# Pure prompt building and response parsing; no SDK or network imports so this loads instantly.
+
+# Define sign_map globally
+sign_map = [
+    ("Gaslighting", "煤气灯效应"),
+    ("Love bombing", "爱轰炸"),
+    ("Blame-shifting", "推卸责任")
+]
+
+
+def build_persona_prompt(lang: str, intensity: str, signs: list) -> str:
+    """
+    Build the persona instructions for the selected language, intensity and signs.
+    """
+    if lang == "English":
+        signs_text = ", ".join(signs)
+        return (
+            f"You are simulating someone with narcissistic personality disorder traits. "
+            f"Your responses should demonstrate the following: {signs_text}. "
+            f"Intensity: {intensity.lower()}. "
+            f"Remain realistic and conversational."
+        )
+    sign_map_dict = dict(sign_map)
+    signs_text = "，".join([sign_map_dict.get(s, s) for s in signs])
+    return (
+        f"你正在模拟具有自恋型人格障碍特征的人。你的回复应体现以下特征：{signs_text}。"
+        f"强度：{intensity}。"
+        f"同时保持真实和对话性。"
+    )
+
+
+class PersonaModel:
+    """
+    A model bound to a fixed persona prompt, shared by every session with the same settings.
+
+    google-generativeai 0.3.x has no system_instruction, so the persona is
+    prepended to each prompt instead of being sent as a separate chat turn.
+    """
+
+    def __init__(self, base_model, persona_prompt: str):
+        self.base_model = base_model
+        self.persona_prompt = persona_prompt
+
+    def full_prompt(self, prompt: str) -> str:
+        return f"{self.persona_prompt}\n{prompt}"
+
+    def generate_content(self, prompt: str, **kwargs):
+        return self.base_model.generate_content(self.full_prompt(prompt), **kwargs)
+
+
+def build_chat_prompt(user_input: str, selected_signs: list, lang: str, history: str = "") -> str:
+    """
+    Build the Gemini chat prompt based on user input, selected tactics, and language.
+
+    history is an optional context block of earlier turns (see context.ConversationContext).
+    """
+    tactic_list = ', '.join(selected_signs)
+    if lang == "English":
+        history_block = f"Conversation so far:\n{history}\n\n" if history else ""
+        return f"""
+You are simulating someone with narcissistic personality disorder traits. Your response should demonstrate one of the following tactics: {tactic_list}.
+
+Given the user's message, reply as the simulated person. Then, on a new line, state the single tactic you used (choose from: {tactic_list}).
+
+Format your response as:
+Reply: <your reply>
+Tactic: <tactic used>
+
+{history_block}User: {user_input}
+"""
+    else:
+        history_block = f"之前的对话：\n{history}\n\n" if history else ""
+        return f"""
+你正在模拟具有自恋型人格障碍特征的人。你的回复应体现以下特征之一：{tactic_list}。
+
+针对用户消息，先以模拟身份回复。然后换行，写明你用的是哪一个特征（从：{tactic_list} 里选一个）。
+
+请严格用如下格式：
+Reply: <你的回复>
+Tactic: <使用的特征>
+
+{history_block}用户: {user_input}
+"""
+
+
+def _scan_fields(assistant_text: str) -> tuple:
+    """
+    Return the last Reply: and Tactic: values found in the text (empty if absent).
+
+    A reply runs from its Reply: line up to the next Tactic: line, so
+    multi-line replies are kept whole.
+    """
+    reply_lines = None
+    reply = ""
+    tactic = ""
+    for line in assistant_text.splitlines():
+        if line.strip().lower().startswith("reply:"):
+            reply_lines = [line.split(":", 1)[1]]
+        elif line.strip().lower().startswith("tactic:"):
+            tactic = line.split(":", 1)[1].strip()
+            if reply_lines is not None:
+                reply = "\n".join(reply_lines).strip()
+                reply_lines = None
+        elif reply_lines is not None:
+            reply_lines.append(line)
+    if reply_lines is not None:
+        # Reply without a following Tactic: line (e.g. a stream cut short)
+        reply = "\n".join(reply_lines).strip()
+    return reply, tactic
+
+
+def parse_response(assistant_text: str) -> tuple:
+    """
+    Parse Gemini response text into reply and tactic.
+    """
+    reply, tactic = _scan_fields(assistant_text)
+    if not reply:
+        reply = assistant_text.strip()
+    return reply, tactic
+
+
+def iter_response_text(response):
+    """
+    Yield the text of each chunk of a streamed Gemini response.
+    """
+    for chunk in response:
+        yield chunk.text
+
+
+class ReplyStream:
+    """
+    Incrementally extract the Reply: body from streamed response chunks.
+
+    Iterating yields the reply text seen so far each time it grows; once the
+    stream is exhausted, result() parses the full text (including the Tactic:
+    line) exactly like parse_response.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.text = ""
+
+    def __iter__(self):
+        shown = ""
+        for chunk in self._chunks:
+            self.text += chunk
+            reply = self._partial_reply()
+            if reply != shown:
+                shown = reply
+                yield reply
+
+    def _partial_reply(self) -> str:
+        text = self.text
+        head, _, last_line = text.rpartition("\n")
+        if head and last_line.strip() and "tactic:".startswith(last_line.strip().lower()):
+            # Do not flash the beginning of an incoming "Tactic:" line as part of the reply
+            text = head
+        return _scan_fields(text)[0]
+
+    def result(self) -> tuple:
+        return parse_response(self.text)
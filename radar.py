@@ -0,0 +1,244 @@
+import math
+from collections import deque
+
+from prompts import sign_map
+
+# Red-flag phrases per tactic (English names as in sign_map). English phrases match
+# case-insensitively on word boundaries; Chinese phrases match anywhere.
+RADAR_LEXICON = {
+    "Gaslighting": {
+        "English": [
+            "never happened", "that's not what happened", "you're imagining", "you are imagining",
+            "too sensitive", "you're crazy", "you are crazy", "i never said", "you're overreacting",
+            "you are overreacting", "remembering it wrong", "you remember it wrong", "no one will believe you",
+            "nobody will believe you", "it was just a joke", "i was only joking", "you're being paranoid",
+            "you're being dramatic", "you're confused", "are you sure you're feeling okay",
+        ],
+        "中文": [
+            "没发生过", "根本没发生", "你想多了", "你太敏感", "你疯了", "我从来没说过", "我没说过", "你记错了",
+            "你在胡思乱想", "你太夸张", "开玩笑而已", "只是开个玩笑", "没人会相信你", "你太玻璃心",
+        ],
+    },
+    "Love bombing": {
+        "English": [
+            "soulmate", "soul mate", "never felt this way", "you're perfect", "you are perfect", "meant to be",
+            "can't live without you", "cannot live without you", "nobody understands me like you",
+            "nobody has ever understood me", "move in together", "love you more than anything",
+            "can't stop thinking about you", "made for each other", "the most amazing person",
+        ],
+        "中文": [
+            "灵魂伴侣", "命中注定", "你太完美", "没有你我活不下去", "离不开你", "从没对任何人有过这种感觉",
+            "搬到一起住", "满脑子都是你", "天生一对", "只有你懂我", "从来没有人像你这样懂我", "最好的人",
+        ],
+    },
+    "Blame-shifting": {
+        "English": [
+            "your fault", "you made me", "because of you", "you always start", "if you hadn't",
+            "if you had not", "look what you made me do", "you pushed me", "you started it", "not my fault",
+            "you brought this on yourself", "you provoked me", "you upset me",
+        ],
+        "中文": [
+            "都怪你", "是你的错", "你逼我", "被你逼的", "要不是你", "是你先", "你自找的", "不是我的错",
+            "还不是因为你", "你惹我",
+        ],
+    },
+}
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def normalize_text(text: str) -> str:
+    return text.lower().replace("’", "'").replace("‘", "'")
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a fixed phrase list.
+
+    Built once; find() then reports every occurrence of every phrase in a
+    single left-to-right pass, independent of how many phrases there are.
+    """
+
+    def __init__(self, phrases: dict):
+        # phrases maps phrase -> label
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for phrase, label in phrases.items():
+            phrase = normalize_text(phrase)
+            state = 0
+            for ch in phrase:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((phrase, label))
+        # Breadth-first pass to fill in failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> list:
+        """
+        Return (start, end, phrase, label) for every match in text.
+        """
+        text = normalize_text(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for phrase, label in out[state]:
+                start = i - len(phrase) + 1
+                # ASCII phrases must not start or end inside a word ("blame" in "blameless")
+                if _is_word_char(phrase[0]) and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if _is_word_char(phrase[-1]) and i + 1 < len(text) and _is_word_char(text[i + 1]):
+                    continue
+                matches.append((start, i + 1, phrase, label))
+        return matches
+
+
+class RadarReport:
+    """
+    Result of a radar scan: per-line hits, per-tactic counts and a quick 0-100 score.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.hits = []
+        self.counts = {}
+        self.flagged_lines = 0
+
+    @property
+    def score(self) -> int:
+        """
+        Saturating score from red flags per scanned line (one flag every three lines is about 63%).
+        """
+        if not self.lines or not self.hits:
+            return 0
+        return round(100 * (1 - math.exp(-3 * len(self.hits) / self.lines)))
+
+    def verdict(self, low: float = 0, high: float = 80, min_lines: int = 20, min_hits: int = 5) -> str:
+        """
+        "benign" (score <= low), "flagged" (score >= high) or "uncertain" (worth an LLM analysis).
+
+        Only scans of at least min_lines lines with at least min_hits red flags
+        are clear-cut; anything shorter or sparser, including text without any
+        hits (the lexicon knows a few dozen phrases), is "uncertain".
+        """
+        if self.lines < min_lines or len(self.hits) < min_hits:
+            return "uncertain"
+        if self.score <= low:
+            return "benign"
+        if self.score >= high:
+            return "flagged"
+        return "uncertain"
+
+
+class Radar:
+    """
+    Local bilingual red-flag detector seeded from the sign_map tactics.
+    """
+
+    def __init__(self, lexicon: dict = None, tactics: list = None):
+        lexicon = lexicon if lexicon is not None else RADAR_LEXICON
+        tactics = tactics if tactics is not None else sign_map
+        phrases = {}
+        for name, _ in tactics:
+            for lang_phrases in lexicon.get(name, {}).values():
+                for phrase in lang_phrases:
+                    phrases[phrase] = name
+        self.matcher = PhraseMatcher(phrases)
+
+    def scan(self, lines) -> RadarReport:
+        """
+        Scan lines (any iterable of str, e.g. iter_decoded_lines) in one pass.
+
+        Hits are (line_number, tactic, phrase) with 1-based line numbers; blank
+        lines are skipped but still counted for numbering.
+        """
+        report = RadarReport()
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            report.lines += 1
+            matches = _leftmost_longest(self.matcher.find(line))
+            if matches:
+                report.flagged_lines += 1
+            for _, _, phrase, tactic in matches:
+                report.hits.append((line_no, tactic, phrase))
+                report.counts[tactic] = report.counts.get(tactic, 0) + 1
+        return report
+
+
+def _leftmost_longest(matches: list) -> list:
+    # Overlapping phrases ("根本没发生" / "没发生过") count as one red flag
+    kept = []
+    for match in sorted(matches, key=lambda m: (m[0], -m[1])):
+        if not kept or match[0] >= kept[-1][1]:
+            kept.append(match)
+    return kept
+
+
+def tactic_label(tactic: str, lang: str) -> str:
+    return tactic if lang == "English" else dict(sign_map).get(tactic, tactic)
+
+
+def format_radar_summary(report: RadarReport, lang: str) -> str:
+    """
+    One-line summary for instant feedback under the text box.
+    """
+    if not report.hits:
+        return "🟢 Radar: no red flags found" if lang == "English" else "🟢 雷达：未发现红旗"
+    counts = ", ".join(f"{tactic_label(t, lang)} ×{n}" for t, n in sorted(report.counts.items()))
+    if lang == "English":
+        return f"🚩 Radar: {len(report.hits)} red flags in {report.flagged_lines} of {report.lines} lines ({counts}) · radar score {report.score}/100"
+    return f"🚩 雷达：{report.lines} 行中有 {report.flagged_lines} 行出现 {len(report.hits)} 个红旗（{counts}）· 雷达评分 {report.score}/100"
+
+
+def format_radar_report(report: RadarReport, lang: str, verdict: str = "flagged", max_lines: int = 20) -> str:
+    """
+    Full result shown instead of an LLM analysis when the radar verdict ("benign" or "flagged") is clear-cut.
+    """
+    benign = verdict == "benign"
+    if lang == "English":
+        reason = ("The red flags were rare enough that no AI analysis was run." if benign else
+                  "The red flags were frequent enough that no AI analysis was run.")
+        parts = [
+            f"**Red-flag radar: {len(report.hits)} red flags in {report.flagged_lines} of {report.lines} lines "
+            f"(radar score {report.score}/100)**",
+            f"_Local phrase matching only, not an NPD assessment. {reason}_",
+        ]
+    else:
+        reason = "红旗很少，因此未进行AI分析。" if benign else "红旗出现得足够频繁，因此未进行AI分析。"
+        parts = [
+            f"**红旗雷达：{report.lines} 行中有 {report.flagged_lines} 行出现 {len(report.hits)} 个红旗（雷达评分 {report.score}/100）**",
+            f"_仅为本地短语匹配，并非NPD评估。{reason}_",
+        ]
+    if report.hits:
+        lines = [
+            f"- {'Line' if lang == 'English' else '第'} {line_no}{'' if lang == 'English' else ' 行'}: "
+            f"{tactic_label(tactic, lang)} — “{phrase}”"
+            for line_no, tactic, phrase in report.hits[:max_lines]
+        ]
+        if len(report.hits) > max_lines:
+            extra = len(report.hits) - max_lines
+            lines.append(f"- … {extra} more" if lang == "English" else f"- …… 另有 {extra} 处")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
@@ -0,0 +1,186 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Session the current call is made on behalf of (set once per Streamlit script run)
+_current_session = contextvars.ContextVar("mirrorshield_session", default="default")
+
+
+def set_session(session_id: str):
+    """
+    Attribute model calls made from the current context to session_id.
+    """
+    _current_session.set(session_id or "default")
+
+
+def current_session() -> str:
+    return _current_session.get()
+
+
+class AdmissionTimeoutError(RuntimeError):
+    """
+    Raised when a request waits longer than queue_timeout for a slot.
+    """
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills at rate tokens per second up to capacity.
+
+    Not thread-safe on its own; RequestScheduler guards it with its lock.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """
+        Seconds until one token is available.
+        """
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class RequestScheduler:
+    """
+    Process-wide admission control for model calls shared by every session.
+
+    A request is admitted when a concurrency slot is free and the token bucket
+    (matched to the API key's requests-per-minute limit) has a token. Waiting
+    requests are granted round-robin across sessions, so one session's burst
+    queues behind its own earlier requests instead of starving others.
+    single_flight() lets identical in-flight requests share one result.
+    """
+
+    def __init__(self, max_concurrency: int = 8, rate: float = 1.0, burst: float = 10,
+                 queue_timeout: float = 60, clock=time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.deduplicated = 0
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._turns = deque()
+        self._granted = set()
+        self._active = 0
+        self._inflight = {}
+
+    def acquire(self, session_id: str = None):
+        """
+        Block until this session's request is admitted; pair with release().
+        """
+        session_id = session_id or current_session()
+        ticket = object()
+        deadline = self._clock() + self.queue_timeout
+        with self._cond:
+            queue = self._queues.get(session_id)
+            if queue is None:
+                queue = self._queues[session_id] = deque()
+                self._turns.append(session_id)
+            queue.append(ticket)
+            while True:
+                self._dispatch()
+                if ticket in self._granted:
+                    self._granted.discard(ticket)
+                    return
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    self._withdraw(session_id, ticket)
+                    raise AdmissionTimeoutError("Too many requests are waiting for the model; please try again.")
+                wait = remaining
+                if self._active < self.max_concurrency:
+                    wait = min(wait, max(self.bucket.wait_time(), 0.001))
+                self._cond.wait(wait)
+
+    def try_acquire(self) -> bool:
+        """
+        Admit immediately if capacity is free and nobody is queued, without waiting.
+        """
+        with self._cond:
+            if self._turns or self._active >= self.max_concurrency or not self.bucket.try_take():
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._dispatch()
+
+    def single_flight(self, key: str, fn):
+        """
+        Run fn once per key at a time; concurrent callers with the same key get the same result.
+        """
+        with self._cond:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.deduplicated += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": sum(len(q) for q in self._queues.values()),
+                "sessions_waiting": len(self._turns),
+                "in_flight_keys": len(self._inflight),
+                "deduplicated": self.deduplicated,
+            }
+
+    def _dispatch(self):
+        granted = False
+        while self._turns and self._active < self.max_concurrency and self.bucket.try_take():
+            session_id = self._turns.popleft()
+            queue = self._queues[session_id]
+            self._granted.add(queue.popleft())
+            self._active += 1
+            granted = True
+            if queue:
+                self._turns.append(session_id)
+            else:
+                del self._queues[session_id]
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw(self, session_id: str, ticket):
+        queue = self._queues.get(session_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[session_id]
+            self._turns.remove(session_id)
@@ -0,0 +1,243 @@
+import atexit
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from transcript import Message
+
+# Session-state keys saved with each session (widget keys; restored before the widgets are created)
+SETTINGS_KEYS = ("language_select", "intensity_select", "signs_select", "random_mode")
+
+
+def new_token() -> str:
+    """
+    Return an unguessable, URL-safe session token.
+    """
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+    """
+    Process-local session store: sessions survive reruns and reconnects to this worker only.
+
+    Sessions idle for more than ttl seconds are dropped, and only the
+    max_sessions most recently used are kept, so abandoned sessions do not
+    accumulate in memory.
+    """
+
+    def __init__(self, ttl: float = 7 * 86400, max_sessions: int = 256, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save_settings(self, token: str, settings: dict):
+        with self._lock:
+            self._entry(token)[0].update(settings)
+
+    def save_message(self, token: str, idx: int, message: Message):
+        with self._lock:
+            self._entry(token)[1][idx] = message.to_row()
+
+    def load(self, token: str):
+        """
+        Return (settings, messages) for token, or None if it is unknown.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            entry[2] = self._clock()
+            self._sessions.move_to_end(token)
+            settings, rows, _ = entry
+            return dict(settings), [Message.from_row(rows[idx]) for idx in sorted(rows)]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire()
+            return len(self._sessions)
+
+    def _entry(self, token: str) -> list:
+        self._expire()
+        entry = self._sessions.get(token)
+        if entry is None:
+            entry = self._sessions[token] = [{}, {}, 0.0]
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        entry[2] = self._clock()
+        self._sessions.move_to_end(token)
+        return entry
+
+    def _expire(self):
+        # Entries are kept in last-used order, so the idle ones are at the front
+        now = self._clock()
+        while self._sessions:
+            token, entry = next(iter(self._sessions.items()))
+            if now - entry[2] <= self.ttl:
+                break
+            del self._sessions[token]
+
+    def delete(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore:
+    """
+    Durable session store in an SQLite file opened in WAL mode.
+
+    Writes are buffered in memory (the latest version of each settings dict and
+    message wins) and committed by a background thread in one transaction every
+    flush_interval seconds, so chat turns never wait on disk. load() flushes
+    first, and pending writes are flushed at interpreter exit. WAL lets every
+    worker process sharing the file read while another writes. Sessions idle
+    for longer than ttl seconds are purged when a store is opened.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5, ttl: float = 7 * 86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending_settings = {}
+        self._pending_messages = {}
+        self._pending_deletes = set()
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._thread = None
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "token TEXT PRIMARY KEY, settings TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                "token TEXT NOT NULL, idx INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "tactic TEXT NOT NULL, guess TEXT, show_tactic INTEGER NOT NULL, revealed INTEGER NOT NULL, "
+                "PRIMARY KEY (token, idx))"
+            )
+            expired = time.time() - ttl
+            self._db.execute(
+                "DELETE FROM session_messages WHERE token IN (SELECT token FROM sessions WHERE updated < ?)",
+                (expired,),
+            )
+            self._db.execute("DELETE FROM sessions WHERE updated < ?", (expired,))
+            self._db.commit()
+        atexit.register(self.close)
+
+    def save_settings(self, token: str, settings: dict):
+        with self._lock:
+            self._pending_settings.setdefault(token, {}).update(settings)
+        self._schedule()
+
+    def save_message(self, token: str, idx: int, message: Message):
+        with self._lock:
+            self._pending_messages.setdefault(token, {})[idx] = message.to_row()
+        self._schedule()
+
+    def load(self, token: str):
+        """
+        Return (settings, messages) for token, or None if it is unknown.
+        """
+        self.flush()
+        with self._db_lock:
+            row = self._db.execute("SELECT settings FROM sessions WHERE token = ?", (token,)).fetchone()
+            if row is None:
+                return None
+            rows = self._db.execute(
+                "SELECT role, content, tactic, guess, show_tactic, revealed FROM session_messages "
+                "WHERE token = ? ORDER BY idx",
+                (token,),
+            ).fetchall()
+        return json.loads(row[0]), [Message.from_row(r) for r in rows]
+
+    def delete(self, token: str):
+        with self._lock:
+            self._pending_settings.pop(token, None)
+            self._pending_messages.pop(token, None)
+            self._pending_deletes.add(token)
+        self._schedule()
+
+    def flush(self):
+        """
+        Commit all buffered writes in a single transaction.
+        """
+        # Holding the DB lock while swapping makes a concurrent flush()/load() wait for this commit
+        with self._db_lock:
+            with self._lock:
+                settings, self._pending_settings = self._pending_settings, {}
+                messages, self._pending_messages = self._pending_messages, {}
+                deletes, self._pending_deletes = self._pending_deletes, set()
+            if not (settings or messages or deletes):
+                return
+            now = time.time()
+            for token in deletes:
+                self._db.execute("DELETE FROM session_messages WHERE token = ?", (token,))
+                self._db.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            for token in settings.keys() | messages.keys():
+                row = self._db.execute("SELECT settings FROM sessions WHERE token = ?", (token,)).fetchone()
+                merged = json.loads(row[0]) if row else {}
+                merged.update(settings.get(token, {}))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (token, settings, updated) VALUES (?, ?, ?)",
+                    (token, json.dumps(merged, ensure_ascii=False), now),
+                )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO session_messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(token, idx) + r for token, rows in messages.items() for idx, r in rows.items()],
+            )
+            self._db.commit()
+
+    def close(self):
+        """
+        Stop the writer thread and flush what is still buffered.
+        """
+        self._closing.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _schedule(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+                    self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._closing.is_set():
+            self._wake.wait()
+            # Coalesce everything written during the interval into one commit (cut short by close())
+            self._closing.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def create_session_store(path: str = None, flush_interval: float = 0.5, ttl: float = 7 * 86400,
+                         max_sessions: int = 256):
+    """
+    Build the SQLite session store for path, or a process-local one (bounded by max_sessions) when path is empty.
+    """
+    if not path:
+        return MemorySessionStore(ttl, max_sessions)
+    return SQLiteSessionStore(path, flush_interval, ttl)
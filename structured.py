@@ -0,0 +1,263 @@
+import json
+import re
+
+from metrics import registry
+from prompts import sign_map, build_chat_prompt, parse_response, ReplyStream
+from radar import Radar
+
+# Extra spellings the model uses for each tactic (English names as in sign_map)
+TACTIC_ALIASES = {
+    "Gaslighting": ["gaslight", "gas lighting", "煤气灯", "煤气灯操纵", "煤气灯操控"],
+    "Love bombing": ["love bomb", "lovebombing", "love-bomb", "爱情轰炸", "情感轰炸", "爱的轰炸"],
+    "Blame-shifting": ["blame shifting", "blame shift", "shifting blame", "shifting the blame", "甩锅", "推卸", "转移责任"],
+}
+
+# Tactic label for a reply whose tactic could be neither read nor inferred; its guess is not scored
+UNKNOWN_TACTIC = {"English": "Unknown", "中文": "未知"}
+
+_KEY_JUNK = re.compile(r"[\s\-_'\"“”‘’`.,;:!?()（）【】\[\]<>《》、，。；：！？*]+")
+
+
+def tactic_key(text: str) -> str:
+    """
+    Normalize a tactic name for lookup: case, spacing, hyphens and punctuation are ignored.
+    """
+    return _KEY_JUNK.sub("", text.casefold())
+
+
+class TacticIndex:
+    """
+    Bilingual lookup from any spelling of a tactic to its sign_map entry.
+
+    Built once from sign_map plus TACTIC_ALIASES. resolve() maps free text
+    such as "love-bombing", "煤气灯" or "Tactic 2: Blame shifting (denial)"
+    to the label the guessing game offers for it.
+    """
+
+    def __init__(self, tactics: list = None, aliases: dict = None):
+        tactics = tactics if tactics is not None else sign_map
+        aliases = aliases if aliases is not None else TACTIC_ALIASES
+        self.tactics = tactics
+        self._canonical = {}
+        for name, zh in tactics:
+            for spelling in [name, zh] + aliases.get(name, []):
+                self._canonical[tactic_key(spelling)] = name
+        # Longest keys first so "煤气灯效应" wins over "煤气灯" in substring search
+        self._by_length = sorted(self._canonical, key=len, reverse=True)
+
+    def canonical(self, text: str):
+        """
+        Return the English sign_map name for text, or None if no tactic is recognized.
+        """
+        if not text:
+            return None
+        key = tactic_key(text)
+        if key in self._canonical:
+            return self._canonical[key]
+        for candidate in self._by_length:
+            if candidate and candidate in key:
+                return self._canonical[candidate]
+        return None
+
+    def label(self, name: str, lang: str) -> str:
+        return name if lang == "English" else dict(self.tactics).get(name, name)
+
+    def resolve(self, text: str, selected_signs: list, lang: str) -> str:
+        """
+        Map text to the matching entry of selected_signs (in whichever language it was picked),
+        or to the tactic's label in lang if it was not selected. Returns "" if unrecognized.
+        """
+        name = self.canonical(text)
+        if name is None:
+            return ""
+        for sign in selected_signs:
+            if self.canonical(sign) == name:
+                return sign
+        return self.label(name, lang)
+
+
+REPLY_PARSE = registry.counter(
+    "mirrorshield_reply_parse_total",
+    "Chat replies parsed, by format found (json/partial/lines) and tactic source (stated/inferred/none)",
+    ("format", "tactic"),
+)
+
+tactic_index = TacticIndex()
+# Used to infer a missing tactic from red-flag phrases in the reply
+_radar = Radar()
+
+
+def reply_schema(selected_signs: list) -> dict:
+    """
+    JSON schema for a structured chat reply offering selected_signs as tactics.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            "reply": {"type": "string"},
+            "tactic": {"type": "string", "enum": list(selected_signs)},
+        },
+        "required": ["reply", "tactic"],
+    }
+
+
+def build_structured_chat_prompt(user_input: str, selected_signs: list, lang: str, history: str = "") -> str:
+    """
+    Like build_chat_prompt, but asks for a JSON object matching reply_schema.
+    """
+    tactic_list = ', '.join(selected_signs)
+    schema = json.dumps(reply_schema(selected_signs), ensure_ascii=False)
+    if lang == "English":
+        history_block = f"Conversation so far:\n{history}\n\n" if history else ""
+        return f"""
+You are simulating someone with narcissistic personality disorder traits. Your response should demonstrate one of the following tactics: {tactic_list}.
+
+Given the user's message, reply as the simulated person and state the single tactic you used (choose from: {tactic_list}).
+
+Respond with only a JSON object matching this JSON schema, with no other text:
+{schema}
+
+{history_block}User: {user_input}
+"""
+    history_block = f"之前的对话：\n{history}\n\n" if history else ""
+    return f"""
+你正在模拟具有自恋型人格障碍特征的人。你的回复应体现以下特征之一：{tactic_list}。
+
+针对用户消息，以模拟身份回复，并写明你用的是哪一个特征（从：{tactic_list} 里选一个）。
+
+只输出一个符合以下 JSON schema 的 JSON 对象，不要输出其他内容：
+{schema}
+
+{history_block}用户: {user_input}
+"""
+
+
+# Stands in for the user's message when the simulated person opens the conversation
+OPENING_INPUT = {
+    "English": "(The conversation is just starting. Send your first message to me.)",
+    "中文": "（对话刚刚开始。请你先给我发第一条消息。）",
+}
+
+
+def build_opening_prompt(selected_signs: list, lang: str, structured: bool = True) -> str:
+    """
+    Prompt for the simulated person's opening message, in the structured or Reply:/Tactic: format.
+    """
+    build_prompt = build_structured_chat_prompt if structured else build_chat_prompt
+    return build_prompt(OPENING_INPUT["English" if lang == "English" else "中文"], selected_signs, lang)
+
+
+def _load_json_object(text: str):
+    """
+    Decode the first JSON object in text, closing a truncated one if needed; None if impossible.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    body = text[start:]
+    decoder = json.JSONDecoder()
+    for suffix in ("", "}", "\"}", "\"\"}"):
+        try:
+            value, _ = decoder.raw_decode(body.rstrip().rstrip("`").rstrip() + suffix)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def partial_json_string(text: str, field: str):
+    """
+    Return the (possibly unfinished) string value of field in partial JSON text, or None.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not match:
+        return None
+    chars = []
+    i = match.end()
+    while i < len(text):
+        ch = text[i]
+        if ch == '"':
+            break
+        if ch == "\\":
+            escape = text[i:i + 6] if text[i + 1:i + 2] == "u" else text[i:i + 2]
+            if len(escape) < 2 or (escape[1] == "u" and len(escape) < 6):
+                # Escape sequence cut off by the end of the chunk
+                break
+            try:
+                chars.append(json.loads('"' + escape + '"'))
+            except ValueError:
+                chars.append(escape[1:])
+            i += len(escape)
+            continue
+        chars.append(ch)
+        i += 1
+    return "".join(chars)
+
+
+def parse_structured_response(text: str, selected_signs: list, lang: str, index: TacticIndex = None) -> tuple:
+    """
+    Parse and validate a chat reply into (reply, tactic) without re-asking the model.
+
+    Accepts the JSON object requested by build_structured_chat_prompt (also
+    inside code fences, with surrounding text or truncated), falling back to
+    partial field extraction and then to the Reply:/Tactic: line format. The
+    tactic is normalized to the matching selected sign; if it is missing or
+    unrecognized it is inferred from red-flag phrases in the reply, or set to
+    the only selected sign when there is just one. Failing that it is the
+    UNKNOWN_TACTIC label, so the reply still gets its guessing widgets.
+    """
+    index = index or tactic_index
+    data = _load_json_object(text)
+    if data is not None:
+        reply, tactic = data.get("reply"), data.get("tactic")
+        fmt = "json"
+    else:
+        reply, tactic = partial_json_string(text, "reply"), partial_json_string(text, "tactic")
+        fmt = "partial"
+    if not isinstance(reply, str) or not reply.strip():
+        reply, line_tactic = parse_response(text)
+        tactic = tactic or line_tactic
+        fmt = "lines"
+    reply = reply.strip()
+    resolved = index.resolve(tactic if isinstance(tactic, str) else "", selected_signs, lang)
+    source = "stated"
+    if not resolved:
+        resolved = _infer_tactic(reply, selected_signs, lang, index)
+        source = "inferred" if resolved else "none"
+    REPLY_PARSE.inc(format=fmt, tactic=source)
+    return reply, resolved or UNKNOWN_TACTIC["English" if lang == "English" else "中文"]
+
+
+def is_unknown_tactic(tactic: str) -> bool:
+    return tactic in UNKNOWN_TACTIC.values()
+
+
+def _infer_tactic(reply: str, selected_signs: list, lang: str, index: TacticIndex) -> str:
+    counts = _radar.scan([reply]).counts
+    allowed = {index.canonical(sign) for sign in selected_signs}
+    ranked = sorted((n, name) for name, n in counts.items() if name in allowed)
+    if ranked:
+        return index.resolve(ranked[-1][1], selected_signs, lang)
+    if len(selected_signs) == 1:
+        return selected_signs[0]
+    return ""
+
+
+class StructuredReplyStream(ReplyStream):
+    """
+    ReplyStream for structured replies: yields the growing "reply" string of the JSON object.
+    """
+
+    def __init__(self, chunks, selected_signs: list, lang: str):
+        super().__init__(chunks)
+        self.selected_signs = selected_signs
+        self.lang = lang
+
+    def _partial_reply(self) -> str:
+        if self.text.lstrip().startswith(("{", "`")):
+            return partial_json_string(self.text, "reply") or ""
+        return super()._partial_reply()
+
+    def result(self) -> tuple:
+        return parse_structured_response(self.text, self.selected_signs, self.lang)
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from analysis import (
+    build_analysis_prompt, parse_analysis_score, iter_decoded_lines, split_windows,
+    analyze_windows, analyze_transcript, merge_scores, format_merged_analysis,
+)
+
+
+def test_build_analysis_prompt_languages():
+    assert "Conversation to analyze:\nhi" in build_analysis_prompt("hi", "English")
+    assert "待分析对话：\n你好" in build_analysis_prompt("你好", "中文")
+
+
+def test_parse_analysis_score():
+    assert parse_analysis_score("NPD Traits Analysis: 75%\nBecause...") == 75
+    assert parse_analysis_score("**NPD特征分析：40.5%**") == 40.5
+    assert parse_analysis_score("no score here") is None
+
+
+def test_iter_decoded_lines_handles_split_multibyte_chars():
+    data = "第一行\r\n第二行\nlast".encode("utf-8")
+    lines = list(iter_decoded_lines(io.BytesIO(data), chunk_size=4))
+    assert lines == ["第一行", "第二行", "last"]
+
+
+def test_split_windows_respects_size_and_overlap():
+    lines = [f"A: message {i}" for i in range(1, 11)]
+    windows = list(split_windows(lines, max_chars=60, overlap_lines=1))
+    assert len(windows) > 1
+    for first, last, text in windows:
+        assert len(text) <= 60
+        assert text.splitlines()[0] == lines[first - 1]
+        assert text.splitlines()[-1] == lines[last - 1]
+    assert windows[1][0] == windows[0][1]
+    assert windows[-1][1] == 10
+
+
+def test_analyze_windows_merges_weighted_scores_in_order():
+    windows = [(1, 2, "x" * 300), (3, 4, "y" * 100)]
+    scores = {"x": 80, "y": 40}
+
+    def generate(prompt):
+        return f"NPD Traits Analysis: {scores[prompt.strip()[-1]]}%\nReason."
+
+    progress = []
+    results = analyze_windows(windows, "English", generate, max_workers=2,
+                              on_progress=lambda done, total: progress.append((done, total)))
+    assert [r["score"] for r in results] == [80, 40]
+    assert merge_scores(results) == 70
+    assert progress[-1] == (2, 2)
+    report = format_merged_analysis(results, "English")
+    assert report.startswith("**NPD Traits Analysis: 70%**")
+    assert "Lines 3–4" in report
+
+
+def test_failed_windows_are_recorded_and_skipped_in_the_merge():
+    lines = [f"A: message {i}" for i in range(60)]
+
+    def generate(prompt):
+        if "message 1\n" in prompt:
+            raise TimeoutError("slow")
+        return "NPD Traits Analysis: 50%\nReason."
+
+    result = analyze_transcript(lines, "English", generate, max_chars=200, overlap_lines=0)
+    assert result["failed_windows"] == 1 and result["score"] == 50.0
+    assert "(failed): TimeoutError: slow" in result["analysis"]
+
+    def broken(prompt):
+        raise ConnectionError("down")
+
+    with pytest.raises(RuntimeError, match="All .* analysis sections failed.*ConnectionError: down"):
+        analyze_transcript(lines, "English", broken, max_chars=200)
+
+
+def test_short_text_is_sent_unchanged():
+    text = "A: hi\n\nB: hello\n"
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return "NPD Traits Analysis: 20%"
+
+    result = analyze_transcript(text.splitlines(), "English", generate, text=text)
+    assert result["windows"] == 1 and result["score"] == 20.0
+    assert prompts == [build_analysis_prompt(text, "English")]
+    long_text = "\n\n".join(f"A: message {i}" for i in range(60))
+    assert analyze_transcript(long_text.splitlines(), "English", generate, max_chars=200, text=long_text)["windows"] > 1
@@ -0,0 +1,53 @@
+import pytest
+
+from backends import (
+    SyntheticBackend, RecordingBackend, ReplayBackend, CassetteMissError, TextResponse, create_backend,
+)
+from utils import build_chat_prompt, parse_response, sign_map
+
+
+def test_synthetic_chat_reply_is_parseable_and_deterministic():
+    backend = SyntheticBackend(sign_map)
+    prompt = build_chat_prompt("Where were you?", ["Love bombing", "Blame-shifting"], "English")
+    text = backend.generate_content(prompt).text
+    assert text == backend.generate_content(prompt).text
+    reply, tactic = parse_response(text)
+    assert reply and tactic in ["Love bombing", "Blame-shifting"]
+
+
+def test_synthetic_chinese_and_analysis():
+    backend = SyntheticBackend(sign_map)
+    reply, tactic = parse_response(backend.respond(build_chat_prompt("你好", ["爱轰炸"], "中文")))
+    assert tactic == "爱轰炸"
+    assert "NPD特征分析：" in backend.respond("请分析以下对话……请用如下格式回答：\"NPD特征分析：X%\"")
+
+
+def test_synthetic_stream_chunks_join_to_text():
+    response = SyntheticBackend(sign_map).generate_content("User: hi", stream=True)
+    assert "".join(chunk.text for chunk in response) == response.text
+
+
+def test_record_then_replay(tmp_path):
+    cassette = str(tmp_path / "cassette.jsonl")
+
+    class Live:
+        def generate_content(self, prompt, stream=False, **kwargs):
+            return TextResponse(f"echo {prompt}", ["echo ", prompt])
+
+    recorder = RecordingBackend(Live(), cassette)
+    assert recorder.generate_content("a").text == "echo a"
+    assert [c.text for c in recorder.generate_content("b", stream=True)] == ["echo ", "b"]
+
+    replay = ReplayBackend(cassette)
+    assert replay.generate_content("a").text == "echo a"
+    assert [c.text for c in replay.generate_content("b", stream=True)] == ["echo ", "b"]
+    with pytest.raises(CassetteMissError):
+        replay.generate_content("never recorded")
+
+
+def test_create_backend_requires_key_only_for_live():
+    assert isinstance(create_backend("synthetic", "m"), SyntheticBackend)
+    with pytest.raises(EnvironmentError):
+        create_backend("live", "m", api_key=None)
+    with pytest.raises(ValueError):
+        create_backend("bogus", "m")
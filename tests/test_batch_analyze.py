@@ -0,0 +1,170 @@
+import contextvars
+import json
+import threading
+
+import pytest
+
+from analysis import analyze_transcript
+from batch_analyze import detect_lang, iter_inputs, load_checkpoint, run_batch
+from radar import Radar
+from scheduler import current_session, set_session
+
+
+def fake_generate(prompt, lang):
+    return "NPD特征分析：40%\n原因。" if lang == "中文" else "NPD Traits Analysis: 70%\nReason."
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.endswith("}\n")]
+
+
+def test_analyze_transcript_single_and_windowed():
+    single = analyze_transcript(["A: hi", "B: hello"], "English", lambda p: fake_generate(p, "English"))
+    assert single == {"score": 70.0, "analysis": "NPD Traits Analysis: 70%\nReason.", "windows": 1, "failed_windows": 0}
+    lines = [f"A: message {i}" for i in range(100)]
+    windowed = analyze_transcript(lines, "English", lambda p: fake_generate(p, "English"), max_chars=200)
+    assert windowed["windows"] > 1 and windowed["score"] == 70.0
+    assert analyze_transcript([], "English", None)["windows"] == 0
+
+
+def test_one_failed_window_does_not_lose_the_transcript(tmp_path):
+    lines = [f"A: message {i}" for i in range(100)]
+
+    def flaky(prompt, lang):
+        if "message 0" in prompt:
+            raise ConnectionError("reset")
+        return fake_generate(prompt, lang)
+
+    output = str(tmp_path / "out.jsonl")
+    run_batch([("t", lambda: lines)], output, flaky, lang="English", max_chars=200, overlap_lines=0)
+    (record,) = read(output)
+    assert "error" not in record and record["score"] == 70.0
+    assert record["failed_windows"] == 1 and "(failed): ConnectionError: reset" in record["analysis"]
+
+
+def test_detect_lang():
+    assert detect_lang("A: 你好吗？\nB: 都怪你") == "中文"
+    assert detect_lang("A: hi, how was the trip to 北京 last week?") == "English"
+
+
+def test_iter_inputs_reads_directories_and_jsonl(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a.txt").write_text("A: hi\r\nB: yo\n", encoding="utf-8")
+    (tmp_path / "b" / "c.txt").write_text("你好", encoding="utf-8")
+    (tmp_path / "notes.md").write_text("skip", encoding="utf-8")
+    assert [(i, f()) for i, f in iter_inputs(str(tmp_path))] == [("a.txt", ["A: hi", "B: yo"]), ("b/c.txt", ["你好"])]
+
+    jsonl = tmp_path / "in.jsonl"
+    jsonl.write_text('{"id": "x", "text": "a\\nb"}\n\n{"text": "c"}\n', encoding="utf-8")
+    assert [(i, f()) for i, f in iter_inputs(str(jsonl))] == [("x", ["a", "b"]), ("3", ["c"])]
+
+
+def test_bad_jsonl_records_fail_on_their_own(tmp_path):
+    jsonl = tmp_path / "in.jsonl"
+    jsonl.write_text('{"id": "1", "text": "A: hi"}\n{"id": "2", "text": \n{"id": "3"}\n[4]\n', encoding="utf-8")
+    output = str(tmp_path / "out.jsonl")
+    assert run_batch(iter_inputs(str(jsonl)), output, fake_generate) == {"analyzed": 1, "skipped": 0, "failed": 3}
+    records = {r["id"]: r for r in read(output)}
+    assert records["1"]["score"] == 70.0
+    assert records["2"]["error"].startswith("ValueError: invalid record on line 2: JSONDecodeError")
+    assert records["3"]["error"] == "ValueError: invalid record on line 3: KeyError: 'text'"
+    assert "line 4" in records["4"]["error"]
+
+
+def test_finished_transcripts_are_kept_when_the_input_fails(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+
+    def inputs():
+        yield "a", lambda: ["A: hi"]
+        raise OSError("disk gone")
+
+    with pytest.raises(OSError):
+        run_batch(inputs(), output, fake_generate)
+    assert [r["id"] for r in read(output)] == ["a"]
+
+
+def test_workers_inherit_the_scheduler_session(tmp_path):
+    sessions = []
+
+    def generate(prompt, lang):
+        sessions.append(current_session())
+        return "NPD Traits Analysis: 10%"
+
+    def batch():
+        set_session("batch")
+        run_batch([("a", lambda: ["A: hi"]), ("b", lambda: ["A: yo"])], str(tmp_path / "out.jsonl"), generate)
+
+    contextvars.copy_context().run(batch)
+    assert sessions == ["batch", "batch"]
+
+
+def test_run_batch_writes_jsonl_and_resumes(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    inputs = [("en", lambda: ["A: hi there"]), ("zh", lambda: ["A: 你好", "B: 我很好"])]
+    assert run_batch(inputs, output, fake_generate, workers=2) == {"analyzed": 2, "skipped": 0, "failed": 0}
+    records = {r["id"]: r for r in read(output)}
+    assert records["en"]["score"] == 70.0 and records["zh"]["score"] == 40.0
+    assert records["zh"]["lang"] == "中文"
+
+    # Simulate an interrupted write, then resume with one new transcript
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "ne')
+    summary = run_batch(inputs + [("new", lambda: ["A: ok"])], output, fake_generate)
+    assert summary == {"analyzed": 1, "skipped": 2, "failed": 0}
+    assert [r["id"] for r in read(output)[-1:]] == ["new"]
+    assert load_checkpoint(output) == {"en", "zh", "new"}
+
+
+def test_failures_are_recorded_and_retried(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+
+    def broken(prompt, lang):
+        raise RuntimeError("quota")
+
+    inputs = [("a", lambda: ["A: hi"])]
+    assert run_batch(inputs, output, broken)["failed"] == 1
+    assert read(output)[0]["error"] == "RuntimeError: quota"
+    assert run_batch(inputs, output, fake_generate)["skipped"] == 1
+    assert run_batch(inputs, output, fake_generate, retry_errors=True)["analyzed"] == 1
+
+
+def test_worker_pool_is_bounded(tmp_path):
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow(prompt, lang):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        threading.Event().wait(0.01)
+        with lock:
+            active.pop()
+        return "NPD Traits Analysis: 10%"
+
+    inputs = [(str(i), lambda: ["A: hi"]) for i in range(20)]
+    assert run_batch(inputs, str(tmp_path / "out.jsonl"), slow, workers=3)["analyzed"] == 20
+    assert max(peak) <= 3
+
+
+def test_radar_triage_skips_the_model(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+
+    def unexpected(prompt, lang):
+        pytest.fail("model should not be called")
+
+    lines = ["It's your fault, you made me do it."] * 20
+    run_batch([("flagged", lambda: lines)], output, unexpected, radar=Radar())
+    record = read(output)[0]
+    assert record["source"] == "radar" and record["score"] is None and record["radar_score"] >= 80
+    assert record["red_flags"] == {"Blame-shifting": 40}
+
+
+def test_radar_triage_sends_unclear_transcripts_to_the_model(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    transcripts = [("short", lambda: ["That is your fault."]), ("no-hits", lambda: ["You are worthless."] * 30)]
+    run_batch(transcripts, output, lambda prompt, lang: "NPD Traits Analysis: 60%", radar=Radar())
+    assert {r["id"]: (r["source"], r["score"]) for r in read(output)} == {
+        "short": ("model", 60.0), "no-hits": ("model", 60.0)
+    }
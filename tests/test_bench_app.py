@@ -0,0 +1,26 @@
+from benchmarks.bench_app import compare, summarize, sample_transcript
+
+
+def test_summarize_reduces_turns_to_medians():
+    per_turn = [
+        {"messages": 2 * i + 3, "chat_turn_s": 0.1 * (i + 1), "render_s": 0.01 * (i + 1), "guess_s": 0.02, "toggle_s": 0.03}
+        for i in range(8)
+    ]
+    summary = summarize({"first_render_s": 0.2, "chat_calls": 8, "per_turn": per_turn})
+    assert summary["chat_calls"] == 8 and "per_turn" not in summary
+    assert abs(summary["chat_turn_s"] - 0.45) < 1e-9
+    assert abs(summary["chat_turn_p95_s"] - 0.8) < 1e-9
+    assert abs(summary["render_first_s"] - 0.015) < 1e-9
+    assert abs(summary["render_last_s"] - 0.075) < 1e-9
+    assert summary["render_by_history"][0] == (3, 0.01)
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"chat_turn_s": 0.1, "peak_memory_mb": 40.0, "chat_calls": 10, "unknown": 1}
+    assert compare({"chat_turn_s": 0.155, "peak_memory_mb": 50.0, "chat_calls": 10}, baseline) == []
+    regressions = compare({"chat_turn_s": 0.2, "peak_memory_mb": 60.0, "chat_calls": 11}, baseline)
+    assert [r.split(":")[0] for r in regressions] == ["chat_turn_s", "peak_memory_mb", "chat_calls"]
+
+
+def test_sample_transcript_has_the_requested_lines():
+    assert len(sample_transcript(25).splitlines()) == 25
@@ -0,0 +1,51 @@
+import time
+
+from cache import ResponseCache, make_cache_key, normalize_prompt
+
+
+def test_make_cache_key_ignores_whitespace_noise():
+    a = make_cache_key("Analyze:\r\n  hello   world  \n", "m", "English")
+    b = make_cache_key("Analyze:\nhello world", "m", "English")
+    assert a == b
+    assert a != make_cache_key("Analyze:\nhello world", "m", "中文")
+    assert a != make_cache_key("Analyze:\nhello world", "other", "English")
+
+
+def test_normalize_prompt_keeps_line_structure():
+    assert normalize_prompt(" a \n\tb  c ") == "a\nb c"
+
+
+def test_memory_lru_evicts_oldest_and_counts():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.01)
+    cache.set("a", "1")
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(path).set("a", "1")
+    cache = ResponseCache(path)
+    assert cache.get("a") == "1"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_size_cap(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(path, max_entries=1, disk_max_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.set(key, key)
+    assert ResponseCache(path).get("a") is None
+    assert ResponseCache(path).get("c") == "c"
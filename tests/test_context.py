@@ -0,0 +1,60 @@
+from context import ConversationContext, estimate_tokens, truncate_to_tokens
+from utils import build_chat_prompt
+
+
+def make_messages(n, text="message number {i} with some extra words"):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": text.format(i=i)}
+        for i in range(n)
+    ]
+
+
+def test_estimate_tokens_english_and_chinese():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("你好 abcd") == 4
+
+
+def test_truncate_to_tokens():
+    text = "你" * 50
+    cut = truncate_to_tokens(text, 10)
+    assert cut.endswith("…")
+    assert estimate_tokens(cut) <= 10
+    assert truncate_to_tokens("short", 10) == "short"
+
+
+def test_recent_turns_verbatim_and_older_summarized():
+    context = ConversationContext(token_budget=400, recent_turns=2)
+    messages = make_messages(10)
+    text = context.build(messages, "English")
+    recent = text.split("Recent messages:\n")[1].splitlines()
+    assert recent == [
+        "User: message number 6 with some extra words",
+        "You: message number 7 with some extra words",
+        "User: message number 8 with some extra words",
+        "You: message number 9 with some extra words",
+    ]
+    assert "Summary of earlier conversation:" in text
+    assert context.folded == 6
+
+
+def test_budget_stays_flat_as_conversation_grows():
+    context = ConversationContext(token_budget=120, recent_turns=3)
+    sizes = []
+    for n in range(2, 200, 2):
+        sizes.append(estimate_tokens(context.build(make_messages(n), "中文")))
+    assert max(sizes) <= 120
+    assert "省略了更早的" in context.build(make_messages(200), "中文")
+
+
+def test_oversized_recent_message_is_truncated():
+    context = ConversationContext(token_budget=50, recent_turns=2)
+    text = context.build([{"role": "user", "content": "word " * 500}], "English")
+    assert estimate_tokens(text) <= 50
+
+
+def test_build_chat_prompt_includes_history():
+    prompt = build_chat_prompt("Hello", ["Gaslighting"], "English", "Recent messages:\nUser: hi")
+    assert "Conversation so far:\nRecent messages:\nUser: hi\n\nUser: Hello" in prompt
+    assert "之前的对话：" in build_chat_prompt("你好", ["爱轰炸"], "中文", "最近的消息：\n用户：嗨")
@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+
+from llm_client import (
+    ResilientClient, CircuitBreaker, CircuitOpenError, LLMTimeoutError, is_quota_error, is_transient_error,
+    classify_error, LLM_CALL_SECONDS, LLM_RETRIES, LLM_RESPONSE_TOKENS, LLM_STREAM_SECONDS,
+)
+from scheduler import AdmissionTimeoutError, RequestScheduler
+
+
+class ApiError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message)
+        self.code = code
+
+
+class FlakyModel:
+    def __init__(self, failures, delay=0.0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+            failure = self.failures.pop(0) if self.failures else None
+        time.sleep(self.delay)
+        if failure:
+            raise failure
+        return f"ok:{prompt}"
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StreamingModel:
+    def __init__(self, chunks=("hello ", "there"), delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.delay)
+        return iter([Chunk(text) for text in self.chunks])
+
+
+def make_client(model, **kwargs):
+    kwargs.setdefault("sleep", lambda seconds: None)
+    return ResilientClient(model, **kwargs)
+
+
+def test_error_classification():
+    assert is_quota_error(ApiError(429))
+    assert is_quota_error(Exception("Quota exceeded for requests"))
+    assert is_transient_error(ApiError(503))
+    assert is_transient_error(TimeoutError())
+    assert not is_transient_error(ApiError(400))
+
+
+def test_classify_error_for_metrics():
+    assert classify_error(ApiError(429)) == "quota"
+    assert classify_error(ApiError(503)) == "server"
+    assert classify_error(ApiError(400)) == "client"
+    assert classify_error(LLMTimeoutError()) == "timeout"
+    assert classify_error(ConnectionResetError()) == "connection"
+    assert classify_error(CircuitOpenError()) == "circuit_open"
+    assert classify_error(AdmissionTimeoutError()) == "admission_timeout"
+    assert classify_error(ValueError()) == "other"
+
+
+def test_calls_and_retries_are_measured():
+    retries = LLM_RETRIES.value(error="server")
+    ok, failed = LLM_CALL_SECONDS.count(mode="blocking", outcome="ok"), LLM_CALL_SECONDS.count(mode="blocking", outcome="client")
+    make_client(FlakyModel([ApiError(503)])).generate_content("hi")
+    with pytest.raises(ApiError):
+        make_client(FlakyModel([ApiError(400)])).generate_content("hi")
+    assert LLM_RETRIES.value(error="server") == retries + 1
+    assert LLM_CALL_SECONDS.count(mode="blocking", outcome="ok") == ok + 1
+    assert LLM_CALL_SECONDS.count(mode="blocking", outcome="client") == failed + 1
+
+
+def test_streamed_response_tokens_are_counted_as_chunks_are_read():
+    tokens, streams = LLM_RESPONSE_TOKENS.value(mode="stream"), LLM_STREAM_SECONDS.count()
+    chunks = make_client(StreamingModel()).generate_content("hi", stream=True)
+    assert LLM_STREAM_SECONDS.count() == streams
+    assert [c.text for c in chunks] == ["hello ", "there"]
+    assert LLM_STREAM_SECONDS.count() == streams + 1
+    assert LLM_RESPONSE_TOKENS.value(mode="stream") > tokens
+
+
+def test_retries_transient_errors_then_succeeds():
+    model = FlakyModel([ApiError(503), ApiError(429)])
+    assert make_client(model, max_retries=3).generate_content("hi") == "ok:hi"
+    assert model.calls == 3
+
+
+def test_does_not_retry_permanent_errors():
+    model = FlakyModel([ApiError(400)])
+    with pytest.raises(ApiError):
+        make_client(model).generate_content("hi")
+    assert model.calls == 1
+
+
+def test_backoff_is_bounded_and_honours_retry_hint():
+    client = make_client(FlakyModel([]), base_delay=1, max_delay=5, rng=lambda: 1.0)
+    assert client.backoff_delay(0, ApiError(503)) == 1
+    assert client.backoff_delay(10, ApiError(503)) == 5
+    assert client.backoff_delay(0, ApiError(429, "Please retry in 3.5s")) == 3.5
+
+
+def test_deadline_raises_timeout():
+    client = make_client(FlakyModel([], delay=0.2), timeout=0.05, max_retries=0)
+    with pytest.raises(LLMTimeoutError):
+        client.generate_content("hi")
+
+
+def test_circuit_breaker_fails_fast_then_probes():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    model = FlakyModel([ApiError(503), ApiError(503)])
+    client = make_client(model, max_retries=1, breaker=breaker)
+    with pytest.raises(ApiError):
+        client.generate_content("hi")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.generate_content("hi")
+    assert model.calls == 2
+    now[0] = 11
+    assert client.generate_content("hi") == "ok:hi"
+    assert breaker.state == "closed"
+
+
+def test_hedged_call_uses_faster_duplicate():
+    class SlowFirst:
+        calls = 0
+
+        def generate_content(self, prompt, **kwargs):
+            SlowFirst.calls += 1
+            if SlowFirst.calls == 1:
+                time.sleep(0.5)
+                return "slow"
+            return "fast"
+
+    client = make_client(SlowFirst(), hedge_after=0.05, timeout=2)
+    start = time.monotonic()
+    assert client.generate_content("hi", hedge=True) == "fast"
+    assert time.monotonic() - start < 0.4
+
+
+def test_stream_holds_its_scheduler_slot_until_read():
+    scheduler = RequestScheduler(max_concurrency=1, rate=1000, burst=1000)
+    client = make_client(StreamingModel(), scheduler=scheduler)
+    stream = client.generate_content("hi", stream=True)
+    time.sleep(0.05)
+    assert scheduler.stats()["active"] == 1
+    assert next(stream).text == "hello "
+    assert scheduler.stats()["active"] == 1
+    assert [c.text for c in stream] == ["there"]
+    assert scheduler.stats()["active"] == 0
+
+
+def test_closed_or_abandoned_streams_release_their_slot():
+    scheduler = RequestScheduler(max_concurrency=1, rate=1000, burst=1000)
+    client = make_client(StreamingModel(), scheduler=scheduler)
+    client.generate_content("hi", stream=True).close()
+    assert scheduler.stats()["active"] == 0
+
+    # A stream that starts after its deadline is never read
+    slow = make_client(StreamingModel(delay=0.2), scheduler=scheduler, timeout=0.05, max_retries=0)
+    with pytest.raises(LLMTimeoutError):
+        slow.generate_content("hi", stream=True)
+    time.sleep(0.3)
+    assert scheduler.stats()["active"] == 0
+
+
+def test_stalled_stream_raises_timeout_and_releases_slot_later():
+    class StallingModel:
+        def generate_content(self, prompt, **kwargs):
+            def chunks():
+                yield Chunk("first")
+                time.sleep(0.3)
+                yield Chunk("late")
+            return chunks()
+
+    scheduler = RequestScheduler(max_concurrency=1, rate=1000, burst=1000)
+    client = make_client(StallingModel(), scheduler=scheduler, timeout=0.05)
+    stream = client.generate_content("hi", stream=True)
+    assert next(stream).text == "first"
+    start = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        next(stream)
+    assert time.monotonic() - start < 0.25
+    # The abandoned read still holds the slot until the upstream call returns
+    assert scheduler.stats()["active"] == 1
+    time.sleep(0.4)
+    assert scheduler.stats()["active"] == 0
+    assert list(stream) == []
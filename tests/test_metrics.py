@@ -0,0 +1,106 @@
+import os
+import pstats
+import urllib.request
+
+from metrics import (
+    Counter, Histogram, MetricsRegistry, RerunTimer, RERUN_SECONDS, SECTION_SECONDS,
+    stats_collector, start_http_exporter, write_metrics_file,
+)
+
+
+def test_counter_labels_and_render():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls made", ("outcome",))
+    calls.inc(outcome="ok")
+    calls.inc(2, outcome='bad "quote"')
+    assert calls.value(outcome="ok") == 1
+    text = registry.render()
+    assert "# HELP calls_total Calls made\n# TYPE calls_total counter\n" in text
+    assert 'calls_total{outcome="ok"} 1\n' in text
+    assert 'calls_total{outcome="bad \\"quote\\""} 2\n' in text
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("x_total", "x")
+    assert registry.counter("x_total", "x") is first
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+    samples = {(name, labels.get("le")): value for name, labels, value in histogram.samples()}
+    assert samples[("latency_seconds_bucket", "0.1")] == 1
+    assert samples[("latency_seconds_bucket", "1")] == 2
+    assert samples[("latency_seconds_bucket", "+Inf")] == 3
+    assert samples[("latency_seconds_sum", None)] == 5.55
+    assert histogram.count() == 3
+
+
+def test_histogram_time_observes_when_the_block_raises():
+    histogram = Histogram("op_seconds", "Op", ("op",))
+    try:
+        with histogram.time(op="fail"):
+            raise ValueError
+    except ValueError:
+        pass
+    assert histogram.count(op="fail") == 1
+
+
+def test_collectors_are_read_at_render_and_failures_are_skipped():
+    registry = MetricsRegistry()
+    stats = {"hits": 3, "size": 7, "name": "ignored"}
+    registry.register_collector(stats_collector("cache", lambda: stats, ("hits",)))
+    registry.register_collector(lambda: 1 / 0)
+    stats["size"] = 8
+    text = registry.render()
+    assert "# TYPE cache_hits_total counter\ncache_hits_total 3\n" in text
+    assert "cache_size 8\n" in text
+    assert "name" not in text
+
+
+def test_rerun_timer_records_sections_and_runs():
+    before = RERUN_SECONDS.count(page="test"), SECTION_SECONDS.count(section="test-section")
+    timer = RerunTimer()
+    timer.lap("test-section")
+    timer.finish("test")
+    timer.finish("test")
+    assert RERUN_SECONDS.count(page="test") == before[0] + 1
+    assert SECTION_SECONDS.count(section="test-section") == before[1] + 1
+
+
+def test_sampled_run_writes_a_profile(tmp_path):
+    timer = RerunTimer(sample_rate=0.5, profile_dir=str(tmp_path), rng=lambda: 0.1)
+    sum(range(1000))
+    timer.finish("chat")
+    (name,) = os.listdir(tmp_path)
+    assert name.startswith("chat-") and name.endswith(".pstats")
+    assert pstats.Stats(str(tmp_path / name)).total_calls > 0
+
+
+def test_abandoned_profiler_is_stopped_by_the_next_run(tmp_path):
+    abandoned = RerunTimer(sample_rate=1, profile_dir=str(tmp_path))
+    # The next run in this thread must be able to profile again
+    timer = RerunTimer(sample_rate=1, profile_dir=str(tmp_path))
+    assert timer._profiler is not None and timer._profiler is not abandoned._profiler
+    timer.finish("settings")
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_file_and_http_exporters(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("up_total", "Up").inc()
+    path = tmp_path / "metrics" / "app.prom"
+    write_metrics_file(str(path), registry)
+    assert "up_total 1" in path.read_text()
+
+    server = start_http_exporter(0, metrics_registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "up_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,64 @@
+import io
+
+from analysis import iter_decoded_lines, parse_analysis_score
+from radar import PhraseMatcher, Radar, format_radar_report, format_radar_summary
+
+
+def test_matcher_finds_overlapping_phrases_in_one_pass():
+    matcher = PhraseMatcher({"根本没发生": "a", "没发生过": "b", "发生": "c", "本来": "d"})
+    found = sorted((start, phrase) for start, _, phrase, _ in matcher.find("他说根本没发生过"))
+    assert found == [(2, "根本没发生"), (4, "没发生过"), (5, "发生")]
+
+
+def test_english_phrases_respect_word_boundaries_and_case():
+    matcher = PhraseMatcher({"your fault": "Blame-shifting", "you're crazy": "Gaslighting"})
+    assert [m[2] for m in matcher.find("It's YOUR FAULT. You’re crazy!")] == ["your fault", "you're crazy"]
+    assert matcher.find("it is not yourfault or your faults") == []
+
+
+def test_scan_reports_per_line_hits_in_both_languages():
+    report = Radar().scan(["A: That never happened.", "", "B: 好的", "A: 根本没发生过，都怪你"])
+    assert report.hits == [
+        (1, "Gaslighting", "never happened"),
+        (4, "Gaslighting", "根本没发生"),
+        (4, "Blame-shifting", "都怪你"),
+    ]
+    assert report.lines == 3 and report.flagged_lines == 2
+    assert report.counts == {"Gaslighting": 2, "Blame-shifting": 1}
+
+
+def test_verdict_triage():
+    radar = Radar()
+    flagged = radar.scan(["It's your fault, you made me do it.", "You're too sensitive."] * 10)
+    assert flagged.score >= 80 and flagged.verdict() == "flagged"
+    mixed = radar.scan(["You're my soulmate."] + ["Let's get lunch."] * 29)
+    assert 0 < mixed.score < 80 and mixed.verdict() == "uncertain"
+    sparse = radar.scan(["It's your fault."] * 5 + ["Let's get lunch."] * 95)
+    assert sparse.verdict(low=30) == "benign"
+
+
+def test_verdict_needs_evidence():
+    radar = Radar()
+    # No lexicon hits is not evidence of benign text
+    assert radar.scan(["Everyone agrees you are worthless."] * 30).verdict() == "uncertain"
+    # A single short, dense line is not enough to skip the model either
+    short = radar.scan(["That is your fault."])
+    assert short.score >= 80 and short.verdict() == "uncertain"
+    assert radar.scan(["It's your fault."] * 3 + ["ok"] * 30).verdict(low=50) == "uncertain"
+
+
+def test_scan_streams_decoded_lines():
+    data = ("Hello\n" * 1000 + "你太敏感了\n").encode("utf-8")
+    report = Radar().scan(iter_decoded_lines(io.BytesIO(data), chunk_size=7))
+    assert report.hits == [(1001, "Gaslighting", "你太敏感")]
+
+
+def test_formatted_report_is_not_labelled_as_an_npd_analysis():
+    report = Radar().scan(["It's your fault."])
+    assert parse_analysis_score(format_radar_report(report, "English")) is None
+    assert parse_analysis_score(format_radar_report(report, "中文")) is None
+    assert f"radar score {report.score}/100" in format_radar_report(report, "English")
+    assert "frequent enough" in format_radar_report(report, "English", "flagged")
+    assert "rare enough" in format_radar_report(report, "English", "benign")
+    assert "红旗很少" in format_radar_report(report, "中文", "benign")
+    assert "推卸责任" in format_radar_summary(report, "中文")
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from llm_client import ResilientClient
+from scheduler import RequestScheduler, TokenBucket, AdmissionTimeoutError, set_session, current_session
+
+
+def test_token_bucket_refills_over_time():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+    assert bucket.try_take() and bucket.try_take()
+    assert not bucket.try_take()
+    assert bucket.wait_time() == 0.5
+    now[0] = 0.5
+    assert bucket.try_take()
+
+
+def test_round_robin_across_sessions():
+    scheduler = RequestScheduler(max_concurrency=1, rate=1000, burst=1000)
+    scheduler.acquire("busy")
+    order = []
+
+    def request(session_id):
+        scheduler.acquire(session_id)
+        order.append(session_id)
+        scheduler.release()
+
+    threads = []
+    for session_id in ["spammer", "spammer", "spammer", "other"]:
+        thread = threading.Thread(target=request, args=(session_id,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    scheduler.release()
+    for thread in threads:
+        thread.join(2)
+    assert order.index("other") <= 1
+
+
+def test_admission_times_out_when_saturated():
+    scheduler = RequestScheduler(max_concurrency=1, rate=1000, burst=1000, queue_timeout=0.05)
+    scheduler.acquire("a")
+    with pytest.raises(AdmissionTimeoutError):
+        scheduler.acquire("b")
+    assert scheduler.stats()["queued"] == 0
+    assert not scheduler.try_acquire()
+    scheduler.release()
+    assert scheduler.try_acquire()
+
+
+def test_single_flight_shares_one_call():
+    scheduler = RequestScheduler(max_concurrency=4, rate=1000, burst=1000)
+    calls = []
+    gate = threading.Event()
+
+    class SlowModel:
+        def generate_content(self, prompt, **kwargs):
+            calls.append(prompt)
+            gate.wait(1)
+            return "shared"
+
+    client = ResilientClient(SlowModel(), scheduler=scheduler)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.generate_content("same"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    gate.set()
+    for thread in threads:
+        thread.join(2)
+    assert results == ["shared"] * 3
+    assert len(calls) == 1
+    assert scheduler.stats()["deduplicated"] == 2
+    assert scheduler.stats()["active"] == 0
+
+
+def test_session_context():
+    set_session("abc")
+    assert current_session() == "abc"
+    set_session(None)
+    assert current_session() == "default"
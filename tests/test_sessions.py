@@ -0,0 +1,95 @@
+import sqlite3
+
+from sessions import SQLiteSessionStore, create_session_store, MemorySessionStore, new_token
+from transcript import Transcript
+
+
+def fill(store, token):
+    transcript = Transcript(on_change=lambda idx, message: store.save_message(token, idx, message))
+    store.save_settings(token, {"language_select": "中文", "signs_select": ["爱轰炸"]})
+    transcript.append("user", "你好")
+    idx = transcript.append("assistant", "我从来没说过那句话", "爱轰炸")
+    transcript.set_guess(idx, "爱轰炸")
+    transcript.set_show_tactic(idx, True)
+    return transcript
+
+
+def test_memory_store_round_trip():
+    store = create_session_store(None)
+    assert isinstance(store, MemorySessionStore)
+    token = new_token()
+    fill(store, token)
+    settings, messages = store.load(token)
+    assert settings["signs_select"] == ["爱轰炸"]
+    assert [m.role for m in messages] == ["user", "assistant"]
+    assert messages[1].guess == "爱轰炸" and messages[1].show_tactic
+    store.delete(token)
+    assert store.load(token) is None
+
+
+def test_memory_store_evicts_idle_and_least_recently_used_sessions():
+    now = [0.0]
+    store = MemorySessionStore(ttl=100, max_sessions=2, clock=lambda: now[0])
+    for token in ("a", "b"):
+        store.save_settings(token, {"language_select": "English"})
+    now[0] = 50
+    assert store.load("a") is not None
+    store.save_settings("c", {})
+    # "b" was the least recently used
+    assert store.load("b") is None and len(store) == 2
+    now[0] = 160
+    store.save_settings("d", {"random_mode": True})
+    # "a" and "c" were last used at 50 and have been idle for more than the ttl
+    assert store.load("a") is None and store.load("c") is None
+    assert store.load("d") == ({"random_mode": True}, [])
+    assert len(store) == 1
+
+
+def test_sqlite_store_survives_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path, flush_interval=60)
+    token = new_token()
+    fill(store, token)
+    store.close()
+
+    # A different process/worker opening the same file
+    settings, messages = SQLiteSessionStore(path).load(token)
+    assert settings == {"language_select": "中文", "signs_select": ["爱轰炸"]}
+    assert messages[1].tactic == "爱轰炸" and messages[1].guess == "爱轰炸"
+    restored = Transcript()
+    restored.restore(messages)
+    assert len(restored) == 2 and restored[0]["content"] == "你好"
+
+
+def test_writes_are_batched_behind(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path, flush_interval=60)
+    token = new_token()
+    fill(store, token)
+    reader = sqlite3.connect(path)
+    assert reader.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 0
+    assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.flush()
+    assert reader.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 2
+
+
+def test_background_writer_flushes_and_delete_removes_rows(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path, flush_interval=0.01)
+    token = new_token()
+    fill(store, token)
+    store._thread.join(0.2)
+    reader = sqlite3.connect(path)
+    assert reader.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
+    store.delete(token)
+    assert store.load(token) is None
+    assert reader.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 0
+
+
+def test_expired_sessions_are_purged_on_open(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path)
+    token = new_token()
+    fill(store, token)
+    store.close()
+    assert SQLiteSessionStore(path, ttl=-1).load(token) is None
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from backends import SyntheticBackend, split_chunks
+from structured import (
+    TacticIndex, build_structured_chat_prompt, parse_structured_response, partial_json_string,
+    StructuredReplyStream, is_unknown_tactic, tactic_index,
+)
+from utils import sign_map
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Gaslighting", "Gaslighting"),
+    ("gas-lighting", "Gaslighting"),
+    ("LOVE BOMBING.", "Love bombing"),
+    ("Tactic 2: Blame shifting (denial)", "Blame-shifting"),
+    ("煤气灯效应", "Gaslighting"),
+    ("甩锅", "Blame-shifting"),
+    ("Silent treatment", None),
+])
+def test_tactic_index_recognizes_spellings(text, expected):
+    assert tactic_index.canonical(text) == expected
+
+
+def test_resolve_returns_the_selected_label_in_either_language():
+    assert tactic_index.resolve("爱轰炸", ["Gaslighting", "Love bombing"], "English") == "Love bombing"
+    assert tactic_index.resolve("love-bombing", ["煤气灯效应", "爱轰炸"], "中文") == "爱轰炸"
+    assert tactic_index.resolve("Blame-shifting", ["爱轰炸"], "中文") == "推卸责任"
+    assert tactic_index.resolve("nonsense", ["爱轰炸"], "中文") == ""
+
+
+def test_structured_prompt_embeds_schema():
+    prompt = build_structured_chat_prompt("Hi", ["Gaslighting", "Love bombing"], "English", "User: earlier")
+    schema = json.loads(prompt.split("no other text:\n")[1].split("\n")[0])
+    assert schema["properties"]["tactic"]["enum"] == ["Gaslighting", "Love bombing"]
+    assert "Conversation so far:\nUser: earlier" in prompt
+    assert prompt.rstrip().endswith("User: Hi")
+    assert "从：煤气灯效应 里选一个" in build_structured_chat_prompt("你好", ["煤气灯效应"], "中文")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"reply": "You\'re imagining it.", "tactic": "Gaslighting"}', ("You're imagining it.", "Gaslighting")),
+    ('```json\n{"reply": "Line one\\nline two", "tactic": "love bombing"}\n```', ("Line one\nline two", "Love bombing")),
+    ('Sure! {"reply": "Fine.", "tactic": "煤气灯效应"} Hope that helps.', ("Fine.", "Gaslighting")),
+    ('{"reply": "We were made for each other', ("We were made for each other", "Love bombing")),
+    ('{"reply": "That never happened."}', ("That never happened.", "Gaslighting")),
+    ("Reply: first\nReply: second\nTactic: Love-Bombing", ("second", "Love bombing")),
+    ("Reply: First line.\nSecond line...\nTactic: Gaslighting", ("First line.\nSecond line...", "Gaslighting")),
+])
+def test_parse_structured_response_repairs_locally(text, expected):
+    assert parse_structured_response(text, ["Gaslighting", "Love bombing"], "English") == expected
+
+
+def test_missing_tactic_with_single_selected_sign():
+    assert parse_structured_response('{"reply": "Hmm."}', ["爱轰炸"], "中文") == ("Hmm.", "爱轰炸")
+
+
+def test_unresolvable_tactic_gets_an_explicit_unknown_label():
+    signs = ["Gaslighting", "Love bombing"]
+    assert parse_structured_response("Just words", signs, "English") == ("Just words", "Unknown")
+    reply, tactic = parse_structured_response('{"reply": "hi", "tactic": null}', signs, "English")
+    assert (reply, tactic) == ("hi", "Unknown") and is_unknown_tactic(tactic)
+    assert parse_structured_response('{"reply": "嗨", "tactic": "冷暴力"}', ["煤气灯效应", "爱轰炸"], "中文") == ("嗨", "未知")
+    assert not is_unknown_tactic("Gaslighting")
+
+
+def test_partial_json_string_handles_cut_escapes():
+    assert partial_json_string('{"reply": "a\\"b', "reply") == 'a"b'
+    assert partial_json_string('{"reply": "caf\\u00', "reply") == "caf"
+    assert partial_json_string('{"tactic": "x"}', "reply") is None
+
+
+def test_structured_stream_yields_reply_and_parses_once():
+    text = json.dumps({"reply": "You're too sensitive, I was joking.", "tactic": "gaslighting"})
+    stream = StructuredReplyStream(split_chunks(text, 5), ["Gaslighting", "Blame-shifting"], "English")
+    partials = list(stream)
+    assert partials[-1] == "You're too sensitive, I was joking."
+    assert all(partials[-1].startswith(p) for p in partials)
+    assert stream.result() == ("You're too sensitive, I was joking.", "Gaslighting")
+
+
+def test_synthetic_backend_answers_structured_prompts():
+    backend = SyntheticBackend(sign_map)
+    for lang, signs in (("English", ["Love bombing", "Blame-shifting"]), ("中文", ["爱轰炸"])):
+        text = backend.respond(build_structured_chat_prompt("Hi", signs, lang))
+        reply, tactic = parse_structured_response(text, signs, lang)
+        assert json.loads(text)["reply"] == reply
+        assert tactic in signs
+
+
+def test_custom_index():
+    index = TacticIndex([("Silent treatment", "冷暴力")], {"Silent treatment": ["stonewalling"]})
+    assert index.resolve("Stonewalling!", ["冷暴力"], "中文") == "冷暴力"
@@ -0,0 +1,72 @@
+import gc
+
+from transcript import Transcript, SpillStore, Message, label_id, label_text
+
+
+def test_labels_are_interned():
+    assert label_id("Gaslighting") == label_id("Gaslighting")
+    assert label_text(label_id("爱轰炸")) == "爱轰炸"
+    assert label_id("") == 0
+
+
+def test_message_supports_dict_style_access():
+    msg = Message("assistant", "hi", label_id("Gaslighting"))
+    assert msg["role"] == "assistant"
+    assert msg.get("tactic") == "Gaslighting"
+    assert msg.get("missing", "x") == "x"
+    assert msg.guess is None
+
+
+def test_in_memory_transcript_tracks_guesses_and_flags():
+    transcript = Transcript()
+    transcript.append("user", "hello")
+    idx = transcript.append("assistant", "reply", "Blame-shifting")
+    transcript.set_guess(idx, "Gaslighting")
+    transcript.set_show_tactic(idx, True)
+    assert len(transcript) == 2
+    assert transcript[-1].guess == "Gaslighting"
+    assert transcript[idx].show_tactic
+    assert [m["role"] for m in transcript] == ["user", "assistant"]
+
+
+def test_on_change_only_reports_real_changes():
+    changes = []
+    transcript = Transcript(on_change=lambda idx, message: changes.append(idx))
+    idx = transcript.append("assistant", "reply", "Gaslighting")
+    transcript.set_guess(idx, "Gaslighting")
+    transcript.set_show_tactic(idx, True)
+    # What every rerun does: re-apply the values already stored
+    transcript.set_guess(idx, "Gaslighting")
+    transcript.set_show_tactic(idx, True)
+    assert changes == [idx, idx, idx]
+
+
+def test_spills_cold_messages_and_reloads_on_demand(tmp_path):
+    store = SpillStore(str(tmp_path / "spill.sqlite3"))
+    transcript = Transcript(store, max_bytes=2000, min_hot=4)
+    for i in range(50):
+        transcript.append("user" if i % 2 == 0 else "assistant", f"message {i} " + "x" * 100, "Gaslighting")
+    assert transcript.memory_bytes() <= 2000
+    assert len(transcript) == 50
+    assert transcript[0].content.startswith("message 0 ")
+    transcript.set_guess(1, "Love bombing")
+    assert transcript[1].guess == "Love bombing"
+    assert [m.content.split()[1] for m in transcript[46:]] == ["46", "47", "48", "49"]
+
+
+def test_spilled_rows_are_dropped_on_close_and_gc(tmp_path):
+    store = SpillStore(str(tmp_path / "spill.sqlite3"))
+    count = lambda: store._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    transcript = Transcript(store, max_bytes=500, min_hot=1)
+    for i in range(20):
+        transcript.append("user", "x" * 100)
+    assert count() > 0
+    transcript.close()
+    assert count() == 0 and len(transcript) == 0
+
+    transcript = Transcript(store, max_bytes=500, min_hot=1)
+    for i in range(20):
+        transcript.append("user", "x" * 100)
+    del transcript
+    gc.collect()
+    assert count() == 0
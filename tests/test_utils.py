@@ -1,5 +1,9 @@
+import os
+import subprocess
+import sys
+
 import pytest
-from utils import build_chat_prompt, parse_response
+from utils import build_chat_prompt, parse_response, ReplyStream, build_persona_prompt, PersonaModel
 
 def test_build_chat_prompt_english():
     prompt = build_chat_prompt("Hello", ["Gaslighting", "Love bombing"], "English")
@@ -27,7 +31,7 @@ def test_parse_response_no_tactic():
     assert tactic == ""
 
 @pytest.mark.parametrize("lines, expected_reply, expected_tactic", [
-    (["Reply:Line1", "Some other line", "Tactic: Love bombing"], "Line1", "Love bombing"),
+    (["Reply:Line1", "Some other line", "Tactic: Love bombing"], "Line1\nSome other line", "Love bombing"),
     (["Random text", "reply: Lowercase test", "TACTIC: Blame-shifting"], "Lowercase test", "Blame-shifting"),
 ])
 
@@ -36,3 +40,48 @@ def test_parse_response_varied(lines, expected_reply, expected_tactic):
     reply, tactic = parse_response(text)
     assert reply == expected_reply
     assert tactic == expected_tactic
+
+
+def test_parse_response_keeps_multi_line_reply():
+    text = "Reply: First line.\nSecond line...\n\nThird line.\nTactic: Gaslighting"
+    assert parse_response(text) == ("First line.\nSecond line...\n\nThird line.", "Gaslighting")
+
+
+def test_reply_stream_yields_growing_reply():
+    chunks = ["Rep", "ly: Hi th", "ere!\nTac", "tic: Gaslighting"]
+    stream = ReplyStream(chunks)
+    partials = list(stream)
+    assert partials == ["Hi th", "Hi there!"]
+    assert stream.result() == ("Hi there!", "Gaslighting")
+
+
+def test_reply_stream_without_markers_matches_parse_response():
+    stream = ReplyStream(["Just some ", "reply"])
+    assert list(stream) == []
+    assert stream.result() == parse_response("Just some reply")
+
+
+def test_build_persona_prompt_chinese_maps_signs():
+    prompt = build_persona_prompt("中文", "高", ["Gaslighting", "爱轰炸"])
+    assert "煤气灯效应，爱轰炸" in prompt
+    assert "强度：高" in prompt
+
+
+def test_persona_model_prepends_persona():
+    class Recorder:
+        def generate_content(self, prompt, **kwargs):
+            return prompt, kwargs
+
+    persona = PersonaModel(Recorder(), build_persona_prompt("English", "High", ["Gaslighting"]))
+    prompt, kwargs = persona.generate_content("User: hi", stream=True)
+    assert prompt.startswith("You are simulating someone")
+    assert "Intensity: high." in prompt
+    assert prompt.endswith("User: hi")
+    assert kwargs == {"stream": True}
+
+
+def test_importing_utils_does_not_load_sdk():
+    code = "import sys, utils; print('google.generativeai' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.strip() == "False"
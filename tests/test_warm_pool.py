@@ -0,0 +1,106 @@
+import threading
+import time
+
+from backends import SyntheticBackend
+from prompts import PersonaModel, build_persona_prompt
+from scheduler import current_session
+from structured import build_opening_prompt, parse_structured_response
+from utils import sign_map
+from warm_pool import WarmPool
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_take_serves_pregenerated_turns_and_refills():
+    calls = []
+
+    def generate(profile):
+        calls.append(profile)
+        return f"{profile}-{len(calls)}"
+
+    pool = WarmPool(generate, per_profile=2, min_demand=1)
+    assert pool.take("en") is None
+    wait_for(lambda: pool.ready("en") == 2)
+    assert pool.take("en") == "en-1"
+    wait_for(lambda: pool.ready("en") == 2)
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+    assert len(calls) == 3
+    pool.close()
+
+
+def test_only_profiles_in_demand_are_refilled():
+    calls = []
+    pool = WarmPool(lambda profile: calls.append(profile) or profile, per_profile=1, min_demand=2)
+    assert pool.take("rare") is None
+    time.sleep(0.05)
+    assert calls == [] and pool.ready("rare") == 0
+    assert pool.take("popular") is None and pool.take("popular") is None
+    wait_for(lambda: pool.ready("popular") == 1)
+    assert pool.take("popular") == "popular"
+    assert calls == ["popular"] * len(calls)
+    pool.close()
+
+
+def test_turns_expire_by_age():
+    now = [0.0]
+    pool = WarmPool(lambda profile: now[0], per_profile=1, max_age=10, min_demand=1, clock=lambda: now[0])
+    pool.warm("p")
+    wait_for(lambda: pool.ready("p") == 1)
+    now[0] = 11.0
+    assert pool.take("p") is None
+    wait_for(lambda: pool.ready("p") == 1)
+    assert pool.take("p") == 11.0
+    pool.close()
+
+
+def test_least_recently_used_profiles_are_evicted():
+    pool = WarmPool(lambda profile: profile, per_profile=1, max_profiles=2)
+    for profile in ("a", "b"):
+        pool.warm(profile)
+        wait_for(lambda: pool.ready(profile) == 1)
+    pool.take("a")
+    pool.warm("c")
+    wait_for(lambda: pool.ready("c") == 1)
+    assert pool.ready("b") == 0 and pool.stats()["profiles"] == 2
+    pool.close()
+
+
+def test_failures_are_not_retried_until_asked_again():
+    attempts = []
+    gate = threading.Event()
+
+    def generate(profile):
+        attempts.append(profile)
+        gate.set()
+        raise RuntimeError("quota")
+
+    pool = WarmPool(generate, per_profile=3)
+    pool.warm("p")
+    gate.wait(1)
+    wait_for(lambda: pool.stats()["failures"] == 1)
+    time.sleep(0.05)
+    assert attempts == ["p"]
+    pool.close()
+
+
+def test_background_calls_use_their_own_scheduling_session():
+    sessions = []
+    pool = WarmPool(lambda profile: sessions.append(current_session()), per_profile=1)
+    pool.warm("p")
+    wait_for(lambda: sessions)
+    assert sessions == ["warm-pool"]
+    pool.close()
+
+
+def test_opening_prompt_round_trip_with_synthetic_backend():
+    for lang, signs in (("English", ["Gaslighting", "Blame-shifting"]), ("中文", ["爱轰炸"])):
+        persona = PersonaModel(SyntheticBackend(sign_map), build_persona_prompt(lang, "High", signs))
+        for structured in (True, False):
+            text = persona.generate_content(build_opening_prompt(signs, lang, structured)).text
+            reply, tactic = parse_structured_response(text, signs, lang)
+            assert reply and tactic in signs
@@ -0,0 +1,251 @@
+import sqlite3
+import sys
+import threading
+import uuid
+import weakref
+
+# Process-wide table of tactic/guess labels; messages store small ints instead of strings
+_labels = [""]
+_label_ids = {"": 0}
+_labels_lock = threading.Lock()
+
+
+def label_id(label: str) -> int:
+    """
+    Return the interned id for a label, adding it to the table on first use.
+    """
+    label = label or ""
+    found = _label_ids.get(label)
+    if found is not None:
+        return found
+    with _labels_lock:
+        if label not in _label_ids:
+            _label_ids[label] = len(_labels)
+            _labels.append(sys.intern(label))
+        return _label_ids[label]
+
+
+def label_text(label: int) -> str:
+    return _labels[label]
+
+
+NO_GUESS = -1
+
+
+class Message:
+    """
+    Slot-based chat message record.
+
+    Supports msg["role"], msg["content"] and msg.get("tactic") so code written
+    against the old dict messages keeps working.
+    """
+
+    __slots__ = ("role", "content", "tactic_id", "guess_id", "show_tactic", "revealed")
+
+    def __init__(self, role: str, content: str, tactic_id: int = 0, guess_id: int = NO_GUESS,
+                 show_tactic: bool = False, revealed: bool = False):
+        self.role = sys.intern(role)
+        self.content = content
+        self.tactic_id = tactic_id
+        self.guess_id = guess_id
+        self.show_tactic = show_tactic
+        self.revealed = revealed
+
+    @property
+    def tactic(self) -> str:
+        return label_text(self.tactic_id)
+
+    @property
+    def guess(self):
+        return None if self.guess_id == NO_GUESS else label_text(self.guess_id)
+
+    def __getitem__(self, key: str):
+        if key not in ("role", "content", "tactic", "guess"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_row(self) -> tuple:
+        """
+        Flatten to (role, content, tactic, guess, show_tactic, revealed) for storage.
+        """
+        return (self.role, self.content, self.tactic, self.guess, int(self.show_tactic), int(self.revealed))
+
+    @classmethod
+    def from_row(cls, row) -> "Message":
+        role, content, tactic, guess, show_tactic, revealed = row
+        return cls(role, content, label_id(tactic), NO_GUESS if guess is None else label_id(guess),
+                   bool(show_tactic), bool(revealed))
+
+    def size(self) -> int:
+        """
+        Approximate bytes held by this record.
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+
+class SpillStore:
+    """
+    SQLite file holding cold messages for every session in this process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session TEXT NOT NULL, idx INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "tactic TEXT NOT NULL, guess TEXT, show_tactic INTEGER NOT NULL, revealed INTEGER NOT NULL, "
+                "PRIMARY KEY (session, idx))"
+            )
+            self._db.commit()
+
+    def put(self, session: str, rows: list):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(session, idx) + m.to_row() for idx, m in rows],
+            )
+            self._db.commit()
+
+    def get(self, session: str, idx: int) -> Message:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT role, content, tactic, guess, show_tactic, revealed FROM messages WHERE session = ? AND idx = ?",
+                (session, idx),
+            ).fetchone()
+        if row is None:
+            raise IndexError(idx)
+        return Message.from_row(row)
+
+    def drop(self, session: str):
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE session = ?", (session,))
+            self._db.commit()
+
+
+class Transcript:
+    """
+    Append-only chat transcript with a per-session memory cap.
+
+    The newest messages stay in memory as Message records. Once they exceed
+    max_bytes, the oldest are spilled to the SpillStore (never fewer than
+    min_hot kept) and read back on demand when accessed. Guesses and the
+    show-tactic flags live on the records themselves. on_change(idx, message),
+    if given, is called after every append and every update that changes a
+    record (e.g. to persist it).
+    """
+
+    def __init__(self, store: SpillStore = None, max_bytes: int = 256 * 1024, min_hot: int = 20, on_change=None):
+        self.session = uuid.uuid4().hex
+        self.store = store
+        self.max_bytes = max_bytes
+        self.min_hot = min_hot
+        self.on_change = on_change
+        self._hot = []
+        self._cold = 0
+        self._hot_bytes = 0
+        if store is not None:
+            # Abandoned sessions release their spilled rows when garbage collected
+            weakref.finalize(self, store.drop, self.session)
+
+    def __len__(self) -> int:
+        return self._cold + len(self._hot)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        if idx >= self._cold:
+            return self._hot[idx - self._cold]
+        return self.store.get(self.session, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def append(self, role: str, content: str, tactic: str = "") -> int:
+        """
+        Add a message and return its index.
+        """
+        message = Message(role, content, label_id(tactic))
+        self._add(message)
+        idx = len(self) - 1
+        if self.on_change is not None:
+            self.on_change(idx, message)
+        return idx
+
+    def restore(self, messages):
+        """
+        Append previously saved Message records without reporting them to on_change.
+        """
+        for message in messages:
+            self._add(message)
+
+    def set_guess(self, idx: int, guess: str):
+        self._update(idx, guess_id=label_id(guess))
+
+    def set_show_tactic(self, idx: int, show: bool):
+        self._update(idx, show_tactic=show)
+
+    def set_revealed(self, idx: int, revealed: bool = True):
+        self._update(idx, revealed=revealed)
+
+    def memory_bytes(self) -> int:
+        return self._hot_bytes
+
+    def close(self):
+        """
+        Forget all messages, including spilled ones.
+        """
+        if self.store is not None:
+            self.store.drop(self.session)
+        self._hot = []
+        self._cold = 0
+        self._hot_bytes = 0
+
+    def _update(self, idx: int, **fields):
+        if idx < 0:
+            idx += len(self)
+        message = self[idx]
+        if all(getattr(message, name) == value for name, value in fields.items()):
+            # Reruns re-apply the current widget values; unchanged records are not rewritten
+            return
+        for name, value in fields.items():
+            setattr(message, name, value)
+        if idx < self._cold:
+            self.store.put(self.session, [(idx, message)])
+        if self.on_change is not None:
+            self.on_change(idx, message)
+
+    def _add(self, message: Message):
+        self._hot.append(message)
+        self._hot_bytes += message.size()
+        self._spill()
+
+    def _spill(self):
+        if self.store is None or self._hot_bytes <= self.max_bytes:
+            return
+        # Spill down to 3/4 of the cap so writes are batched rather than one per message
+        count = 0
+        spilled_bytes = 0
+        while (self._hot_bytes - spilled_bytes > self.max_bytes * 3 // 4
+               and len(self._hot) - count > self.min_hot):
+            spilled_bytes += self._hot[count].size()
+            count += 1
+        if not count:
+            return
+        self.store.put(self.session, [(self._cold + i, m) for i, m in enumerate(self._hot[:count])])
+        del self._hot[:count]
+        self._cold += count
+        self._hot_bytes -= spilled_bytes
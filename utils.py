@@ -1,66 +1,137 @@
 import os
-import google.generativeai as genai
+import threading
 from dotenv import load_dotenv
+from backends import create_backend
+from llm_client import ResilientClient, CircuitBreaker
+from scheduler import RequestScheduler
+# Prompt helpers live in prompts.py (no SDK imports); re-exported here for existing callers
+from prompts import (
+    sign_map, build_persona_prompt, PersonaModel, build_chat_prompt, parse_response,
+    iter_response_text, ReplyStream,
+)
 
-# Load environment and configure Gemini API key
+# Load environment and Gemini API key (only the live and record backends need it)
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise EnvironmentError("No API key found. Please set GOOGLE_API_KEY in .env.")
-genai.configure(api_key=api_key)
-
-# Define sign_map globally
-sign_map = [
-    ("Gaslighting", "煤气灯效应"),
-    ("Love bombing", "爱轰炸"),
-    ("Blame-shifting", "推卸责任")
-]
 
 MODEL = "models/gemini-1.5-flash"
-model = genai.GenerativeModel(model_name=MODEL)
 
-def build_chat_prompt(user_input: str, selected_signs: list, lang: str) -> str:
-    """
-    Build the Gemini chat prompt based on user input, selected tactics, and language.
-    """
-    tactic_list = ', '.join(selected_signs)
-    if lang == "English":
-        return f"""
-You are simulating someone with narcissistic personality disorder traits. Your response should demonstrate one of the following tactics: {tactic_list}.
+# Model backend: live (Gemini), record (live + write cassette), replay (serve cassette) or synthetic
+BACKEND = os.getenv("MIRRORSHIELD_BACKEND", "live")
+
+# All app traffic goes through the resilient client: deadlines, jittered retries, circuit breaker
+LLM_TIMEOUT = float(os.getenv("MIRRORSHIELD_LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("MIRRORSHIELD_LLM_MAX_RETRIES", "3"))
+LLM_HEDGE_AFTER = float(os.getenv("MIRRORSHIELD_LLM_HEDGE_AFTER", "4"))
+
+# Process-wide admission control shared by every session (match RPM to the API key's limit)
+scheduler = RequestScheduler(
+    max_concurrency=int(os.getenv("MIRRORSHIELD_MAX_CONCURRENCY", "8")),
+    rate=float(os.getenv("MIRRORSHIELD_RATE_LIMIT_RPM", "60")) / 60,
+    burst=float(os.getenv("MIRRORSHIELD_RATE_LIMIT_BURST", "10")),
+    queue_timeout=float(os.getenv("MIRRORSHIELD_QUEUE_TIMEOUT", "60")),
+)
+
+# Stream chat replies token-by-token (set MIRRORSHIELD_STREAM_CHAT=0 to disable)
+STREAM_CHAT = os.getenv("MIRRORSHIELD_STREAM_CHAT", "1") != "0"
+
+# Ask for chat replies as JSON matching a schema, validated and repaired locally (0 for the Reply:/Tactic: format)
+STRUCTURED_CHAT = os.getenv("MIRRORSHIELD_STRUCTURED_CHAT", "1") != "0"
 
-Given the user's message, reply as the simulated person. Then, on a new line, state the single tactic you used (choose from: {tactic_list}).
+# The simulated person opens each session; openers are pre-generated per settings profile in the background
+OPENING_TURN = os.getenv("MIRRORSHIELD_OPENING_TURN", "0") != "0"
+WARM_POOL_SIZE = int(os.getenv("MIRRORSHIELD_WARM_POOL_SIZE", "2"))
+WARM_POOL_MIN_DEMAND = int(os.getenv("MIRRORSHIELD_WARM_POOL_MIN_DEMAND", "2"))
+WARM_POOL_MAX_AGE = float(os.getenv("MIRRORSHIELD_WARM_POOL_MAX_AGE", "3600"))
+WARM_POOL_PROFILES = int(os.getenv("MIRRORSHIELD_WARM_POOL_PROFILES", "16"))
 
-Format your response as:
-Reply: <your reply>
-Tactic: <tactic used>
+# Max number of distinct settings profiles whose persona models are kept in memory
+PERSONA_CACHE_SIZE = int(os.getenv("MIRRORSHIELD_PERSONA_CACHE_SIZE", "32"))
 
-User: {user_input}
-"""
-    else:
-        return f"""
-你正在模拟具有自恋型人格障碍特征的人。你的回复应体现以下特征之一：{tactic_list}。
+# Response cache for analysis and chat prompts (set MIRRORSHIELD_CACHE_PATH= to keep it in memory only)
+CACHE_PATH = os.getenv("MIRRORSHIELD_CACHE_PATH", ".mirrorshield_cache.sqlite3")
+CACHE_TTL = float(os.getenv("MIRRORSHIELD_CACHE_TTL", "86400"))
+CACHE_SIZE = int(os.getenv("MIRRORSHIELD_CACHE_SIZE", "256"))
+CACHE_DISK_SIZE = int(os.getenv("MIRRORSHIELD_CACHE_DISK_SIZE", "10000"))
 
-针对用户消息，先以模拟身份回复。然后换行，写明你用的是哪一个特征（从：{tactic_list} 里选一个）。
+# Transcript analysis: uploads larger than LARGE_UPLOAD_BYTES are decoded incrementally,
+# split into overlapping windows and analyzed in parallel
+ANALYSIS_WINDOW_CHARS = int(os.getenv("MIRRORSHIELD_ANALYSIS_WINDOW_CHARS", "12000"))
+ANALYSIS_OVERLAP_LINES = int(os.getenv("MIRRORSHIELD_ANALYSIS_OVERLAP_LINES", "4"))
+ANALYSIS_WORKERS = int(os.getenv("MIRRORSHIELD_ANALYSIS_WORKERS", "4"))
+LARGE_UPLOAD_BYTES = int(os.getenv("MIRRORSHIELD_LARGE_UPLOAD_BYTES", "50000"))
 
-请严格用如下格式：
-Reply: <你的回复>
-Tactic: <使用的特征>
+# Local red-flag radar triage (opt-in): clear-cut texts scoring <= RADAR_LOW or >= RADAR_HIGH, with at least
+# RADAR_MIN_LINES lines and RADAR_MIN_HITS red flags, are answered without an LLM call
+RADAR_TRIAGE = os.getenv("MIRRORSHIELD_RADAR_TRIAGE", "0") != "0"
+RADAR_LOW = float(os.getenv("MIRRORSHIELD_RADAR_LOW", "0"))
+RADAR_HIGH = float(os.getenv("MIRRORSHIELD_RADAR_HIGH", "80"))
+RADAR_MIN_LINES = int(os.getenv("MIRRORSHIELD_RADAR_MIN_LINES", "20"))
+RADAR_MIN_HITS = int(os.getenv("MIRRORSHIELD_RADAR_MIN_HITS", "5"))
 
-用户: {user_input}
-"""
+# Chat turns rendered in full; older turns collapse into a widget-free archive
+HISTORY_RECENT_TURNS = int(os.getenv("MIRRORSHIELD_HISTORY_RECENT_TURNS", "10"))
 
+# Earlier turns sent with each chat prompt: recent turns verbatim, older ones summarized, within a token budget
+CONTEXT_TOKEN_BUDGET = int(os.getenv("MIRRORSHIELD_CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_RECENT_TURNS = int(os.getenv("MIRRORSHIELD_CONTEXT_RECENT_TURNS", "4"))
 
-def parse_response(assistant_text: str) -> tuple:
+# Per-session transcript memory cap; older messages spill to this SQLite file and reload on demand
+SESSION_MEMORY_BYTES = int(os.getenv("MIRRORSHIELD_SESSION_MEMORY_KB", "256")) * 1024
+SPILL_PATH = os.getenv("MIRRORSHIELD_SPILL_PATH", ".mirrorshield_spill.sqlite3")
+
+# Durable sessions keyed by the ?session= URL token (set MIRRORSHIELD_SESSION_DB= to keep them per-process)
+SESSION_DB_PATH = os.getenv("MIRRORSHIELD_SESSION_DB", ".mirrorshield_sessions.sqlite3")
+SESSION_FLUSH_INTERVAL = float(os.getenv("MIRRORSHIELD_SESSION_FLUSH_INTERVAL", "0.5"))
+SESSION_TTL = float(os.getenv("MIRRORSHIELD_SESSION_TTL", "604800"))
+SESSION_MEMORY_MAX = int(os.getenv("MIRRORSHIELD_SESSION_MEMORY_MAX", "256"))
+
+# Prometheus-format metrics (empty = off) and sampled cProfile dumps of script runs
+METRICS_PORT = os.getenv("MIRRORSHIELD_METRICS_PORT", "")
+METRICS_FILE = os.getenv("MIRRORSHIELD_METRICS_FILE", "")
+METRICS_INTERVAL = float(os.getenv("MIRRORSHIELD_METRICS_INTERVAL", "15"))
+PROFILE_SAMPLE_RATE = float(os.getenv("MIRRORSHIELD_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("MIRRORSHIELD_PROFILE_DIR", "profiles")
+
+# The backend (and the Gemini SDK behind it) is only built on first use
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ResilientClient:
     """
-    Parse Gemini response text into reply and tactic.
+    Return the process-wide resilient client, building the model backend on first call.
     """
-    reply = ""
-    tactic = ""
-    for line in assistant_text.splitlines():
-        if line.strip().lower().startswith("reply:"):
-            reply = line.split(":", 1)[1].strip()
-        elif line.strip().lower().startswith("tactic:"):
-            tactic = line.split(":", 1)[1].strip()
-    if not reply:
-        reply = assistant_text.strip()
-    return reply, tactic
+    global _client
+    with _client_lock:
+        if _client is None:
+            model = create_backend(
+                BACKEND,
+                MODEL,
+                api_key=api_key,
+                cassette_path=os.getenv("MIRRORSHIELD_CASSETTE", "cassettes/gemini.jsonl"),
+                latency=float(os.getenv("MIRRORSHIELD_BACKEND_LATENCY", "0")),
+                chunk_delay=float(os.getenv("MIRRORSHIELD_BACKEND_CHUNK_DELAY", "0")),
+                tactics=sign_map,
+            )
+            _client = ResilientClient(
+                model,
+                timeout=LLM_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES,
+                hedge_after=LLM_HEDGE_AFTER,
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.getenv("MIRRORSHIELD_LLM_BREAKER_THRESHOLD", "5")),
+                    reset_timeout=float(os.getenv("MIRRORSHIELD_LLM_BREAKER_RESET", "30")),
+                ),
+                scheduler=scheduler,
+            )
+        return _client
+
+
+def __getattr__(name: str):
+    # utils.model / utils.client still work, but build lazily
+    if name == "client":
+        return get_client()
+    if name == "model":
+        return get_client().model
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
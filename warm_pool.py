@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from scheduler import set_session
+
+
+class WarmPool:
+    """
+    Bounded pool of pre-generated opening turns per settings profile.
+
+    generate(profile) produces one parsed opening turn (e.g. (reply, tactic))
+    and is only ever called from a background thread. take() serves the
+    oldest unexpired turn for a profile instantly, or None on a miss. Only
+    popular profiles are refilled: take() queues a refill once a profile has
+    been asked for min_demand times, so settings combinations nobody uses
+    twice never cost a background generation. warm() queues a refill
+    explicitly, regardless of demand. At most per_profile turns are kept for
+    each of the max_profiles most recently used profiles; turns older than
+    max_age seconds are discarded. A failed generation is not retried until
+    the profile is asked for again.
+    """
+
+    def __init__(self, generate, per_profile: int = 2, max_age: float = 3600, max_profiles: int = 16,
+                 min_demand: int = 2, clock=time.monotonic):
+        self.generate = generate
+        self.per_profile = per_profile
+        self.max_age = max_age
+        self.max_profiles = max_profiles
+        self.min_demand = min_demand
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._entries = OrderedDict()
+        self._demand = {}
+        self._wanted = deque()
+        self._busy = None
+        self._closed = False
+        self._thread = None
+
+    def warm(self, profile):
+        """
+        Ask for profile to be filled in the background.
+        """
+        with self._cond:
+            self._touch(profile)
+            self._request(profile)
+
+    def take(self, profile):
+        """
+        Return a pre-generated turn for profile, or None if none is ready.
+        """
+        with self._cond:
+            entries = self._touch(profile)
+            self._expire(entries)
+            if entries:
+                self.hits += 1
+                value = entries.popleft()[1]
+            else:
+                self.misses += 1
+                value = None
+            self._demand[profile] = self._demand.get(profile, 0) + 1
+            if self._demand[profile] >= self.min_demand:
+                self._request(profile)
+            return value
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "profiles": len(self._entries),
+                "ready": sum(len(e) for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+                "failures": self.failures,
+            }
+
+    def ready(self, profile) -> int:
+        with self._cond:
+            entries = self._entries.get(profile)
+            return len(entries) if entries else 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _touch(self, profile) -> deque:
+        # Most recently used profiles are kept; the least recently used one is evicted past max_profiles
+        entries = self._entries.get(profile)
+        if entries is None:
+            entries = self._entries[profile] = deque()
+            while len(self._entries) > self.max_profiles:
+                evicted, _ = self._entries.popitem(last=False)
+                self._demand.pop(evicted, None)
+        self._entries.move_to_end(profile)
+        return entries
+
+    def _expire(self, entries: deque):
+        now = self._clock()
+        while entries and now - entries[0][0] > self.max_age:
+            entries.popleft()
+
+    def _request(self, profile):
+        if self.per_profile <= 0 or profile in self._wanted or profile == self._busy:
+            return
+        self._wanted.append(profile)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="warm-pool", daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _run(self):
+        # Background generations queue behind interactive requests of their own "session"
+        set_session("warm-pool")
+        while True:
+            with self._cond:
+                while not self._wanted and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                profile = self._wanted.popleft()
+                entries = self._entries.get(profile)
+                if entries is None:
+                    continue
+                self._expire(entries)
+                if len(entries) >= self.per_profile:
+                    continue
+                self._busy = profile
+            try:
+                value = self.generate(profile)
+            except Exception:
+                with self._cond:
+                    self.failures += 1
+                    self._busy = None
+                continue
+            with self._cond:
+                self._busy = None
+                self.generated += 1
+                entries = self._entries.get(profile)
+                if entries is None:
+                    continue
+                entries.append((self._clock(), value))
+                if len(entries) < self.per_profile:
+                    self._request(profile)